@@ -4,16 +4,28 @@
 
 
 import os
+import cProfile
+import re
+import json
+import hashlib
+import tempfile
+import time
+import uuid
+import contextlib
+import contextvars
 import sqlite3
-from datetime import datetime, timedelta
-from flask import Flask, render_template_string, request, jsonify, send_file, redirect, url_for
-from reportlab.lib.pagesizes import letter, A4
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib import colors
-from reportlab.lib.units import inch
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+import click
+from flask import Flask, Response, g, has_request_context, render_template, request, jsonify, send_file, redirect, url_for
+from dataclasses import dataclass
+from types import MappingProxyType, SimpleNamespace
 import io
 import calendar
+import html
 
 app = Flask(__name__)
 
@@ -25,6 +37,16 @@ STAFF_MEMBERS = [
     "Asad Anwar Khan"
 ]
 
+# Branch offices, each with its own staff list and database shard. Every route takes a
+# ?branch= parameter; without one it works on DEFAULT_BRANCH
+DEFAULT_BRANCH = 'main'
+BRANCHES = {
+    'main': {'name': 'Main Office', 'staff': STAFF_MEMBERS},
+}
+
+# Threads used to query every branch's shard in parallel for cross-branch reports
+BRANCH_FANOUT_WORKERS = 4
+
 # Points system configuration
 POINTS_CONFIG = {
     'full_day_present': 10,      # Full day attendance (7.5+ hours)
@@ -38,9 +60,460 @@ POINTS_CONFIG = {
     'field_work': 10,            # Field work or warehouse counts as full day
 }
 
+# Rendered PDF cache on disk, least recently used files are evicted beyond the size limit
+PDF_CACHE_DIR = 'pdf_cache'
+PDF_CACHE_MAX_BYTES = 100 * 1024 * 1024     # Set to 0 to disable the cache and stream every report
+
+# Uncached reports are rendered into a spooled temp file (kept in memory up to this size) and streamed
+PDF_SPOOL_MAX_BYTES = 1024 * 1024
+PDF_STREAM_CHUNK_SIZE = 64 * 1024
+
+# Background report jobs: worker threads, how many finished jobs to remember, and
+# seconds a job's status record stays on disk for other workers after its last update
+REPORT_JOB_WORKERS = 2
+REPORT_JOB_HISTORY = 200
+REPORT_JOB_RECORD_MAX_AGE = 24 * 60 * 60
+
+# Production server (flask serve, needs gunicorn): worker processes, request threads per
+# worker, seconds a request may take, and how long a graceful restart waits for in-flight work
+SERVER_CONFIG = {
+    'workers': os.cpu_count() or 2,
+    'threads': 4,
+    'timeout': 120,
+    'graceful_timeout': 30,
+    'max_requests': 0,           # Recycle a worker after this many requests (0 = never)
+}
+
+# Biometric punch log import: accepted header names (case-insensitive), timestamp
+# formats tried after ISO 8601, days written per transaction and rejects reported
+PUNCH_LOG_COLUMNS = {
+    'name': ('name', 'staff_name', 'employee', 'employee name', 'user'),
+    'timestamp': ('timestamp', 'datetime', 'punch_time', 'punch time', 'time stamp'),
+    'date': ('date', 'punch_date'),
+    'time': ('time', 'clock_time')
+}
+PUNCH_TIMESTAMP_FORMATS = ('%d/%m/%Y %H:%M:%S', '%d/%m/%Y %H:%M', '%d-%m-%Y %H:%M:%S', '%d-%m-%Y %H:%M', '%Y/%m/%d %H:%M:%S')
+PUNCH_IMPORT_BATCH_SIZE = 2000
+PUNCH_IMPORT_MAX_REJECTED = 500
+
+# Raw data exports: columns in file order and rows fetched per cursor batch
+EXPORT_COLUMNS = ('date', 'staff_name', 'status', 'entry_time', 'exit_time', 'duty_hours', 'points', 'remarks', 'timestamp')
+EXPORT_BATCH_SIZE = 500
+
+# Import ReportLab in a background thread once the first request has been served, so the
+# first report download doesn't pay for it (ReportLab is otherwise loaded on first use)
+PDF_WARMUP = False
+
+# Offline check-in sync: most queued edits accepted by one /sync_attendance request
+SYNC_MAX_CHANGES = 1000
+
+# Years accepted in report, stats and holiday parameters
+MIN_YEAR, MAX_YEAR = 1900, 9999
+
+# Number of (year, month) entries kept in the monthly stats cache
+MONTHLY_STATS_CACHE_SIZE = 36
+
+# Number of leaderboard periods kept in the leaderboard cache
+LEADERBOARD_CACHE_SIZE = 64
+
+# Request, SQL and PDF instrumentation exposed at /metrics
+METRICS_CONFIG = {
+    'latency_buckets': (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+    'sql_buckets': (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1),
+    'profile_slow_requests': False,  # Profile every request with cProfile and keep dumps of slow ones
+    'slow_request_seconds': 1.0,     # Requests slower than this get a profile dump
+    'profile_dir': 'profiles',       # Where .prof files are written (open with pstats or snakeviz)
+}
+
+# Thresholds used by the points engine (see refresh_points_engine)
+THRESHOLDS_CONFIG = {
+    'early_arrival': '10:00',    # Arriving at or before this time is early
+    'late_arrival': '10:30',     # Arriving after this time is late
+    'full_day_hours': 7.5,       # Duty hours for a full day, overtime starts after this
+    'half_day_hours': 4,         # Duty hours for a half day
+}
+
+# Attendance statuses accepted from the check-in page
+ATTENDANCE_STATUSES = ('present', 'field_work', 'absent')
+
+# Field work or warehouse days are recorded as a full day
+FIELD_WORK_HOURS = 7.5
+
+MINUTES_PER_DAY = 24 * 60
+TIME_PATTERN = re.compile(r'(\d{1,2}):(\d{1,2})$')
+
+# Compact storage: statuses are stored as these codes (never renumber them), days as
+# days since 1970-01-01 and times as minutes since midnight
+STATUS_CODES = {'present': 1, 'field_work': 2, 'absent': 3}
+STATUS_NAMES = {code: status for status, code in STATUS_CODES.items()}
+EPOCH_ORDINAL = datetime(1970, 1, 1).toordinal()
+TIME_LABELS = tuple(f'{minutes // 60:02d}:{minutes % 60:02d}' for minutes in range(MINUTES_PER_DAY))
+
+# Database files and per-connection tuning; the default branch keeps DATABASE_PATH,
+# other branches get BRANCH_DATABASE_PATH with their key filled in
+DATABASE_PATH = 'attendance.db'
+BRANCH_DATABASE_PATH = 'attendance_{branch}.db'
+
+SQLITE_CONFIG = {
+    'busy_timeout': 5000,        # Milliseconds a writer waits for a lock before failing
+    'synchronous': 'NORMAL',     # Safe with WAL, avoids an fsync per commit
+    'cache_size': -16000,        # Page cache in KiB (negative) - 16 MB per connection
+    'mmap_size': 268435456,      # Memory-map up to 256 MB of the database file
+    'temp_store': 'MEMORY',      # Sorts and temp tables stay in memory
+}
+
+# Totals summed from scratch in the shape of staff_month_totals: points and hours of
+# non-absent days (hours in hundredths) and days present or on field work
+MONTH_TOTALS_REBUILD_QUERY = '''
+    SELECT CAST(strftime('%Y%m', day * 86400, 'unixepoch') AS INTEGER) AS month,
+           staff_id,
+           SUM(CASE WHEN status != 3 THEN points ELSE 0 END),
+           SUM(CASE WHEN status != 3 THEN CAST(ROUND(duty_hours * 100) AS INTEGER) ELSE 0 END),
+           SUM(status IN (1, 2))
+    FROM attendance_days
+    GROUP BY month, staff_id
+'''
+
+# The same totals for the days in a range of whole months, to rebuild just those months
+MONTH_TOTALS_RANGE_REBUILD_QUERY = '''
+    SELECT CAST(strftime('%Y%m', day * 86400, 'unixepoch') AS INTEGER) AS month,
+           staff_id,
+           SUM(CASE WHEN status != 3 THEN points ELSE 0 END),
+           SUM(CASE WHEN status != 3 THEN CAST(ROUND(duty_hours * 100) AS INTEGER) ELSE 0 END),
+           SUM(status IN (1, 2))
+    FROM attendance_days
+    WHERE day BETWEEN ? AND ?
+    GROUP BY month, staff_id
+'''
+
+# Schema migrations, applied in order and tracked with PRAGMA user_version;
+# an entry is one statement or a tuple of statements run in one transaction
+MIGRATIONS = [
+    # 1: report queries filter on date, the UNIQUE(staff_name, date) index leads with staff_name
+    'CREATE INDEX IF NOT EXISTS idx_attendance_date_staff ON attendance (date, staff_name)',
+    # 2: per-day and per-month data versions, bumped on every write, used to key cached reports
+    '''CREATE TABLE IF NOT EXISTS data_versions (
+        period TEXT PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0,
+        updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )''',
+    # 3: compact schema - a staff table, integer day numbers, minutes and status codes in a
+    # table clustered on (day, staff_id); the old attendance table becomes a decoding view
+    (
+        '''CREATE TABLE staff (
+            id INTEGER PRIMARY KEY,
+            name TEXT NOT NULL UNIQUE
+        )''',
+        'INSERT INTO staff (name) SELECT DISTINCT staff_name FROM attendance ORDER BY staff_name',
+        '''CREATE TABLE attendance_days (
+            day INTEGER NOT NULL,
+            staff_id INTEGER NOT NULL REFERENCES staff (id),
+            status INTEGER NOT NULL,
+            entry_minute INTEGER,
+            exit_minute INTEGER,
+            duty_hours REAL NOT NULL DEFAULT 0,
+            remarks TEXT,
+            points INTEGER NOT NULL DEFAULT 0,
+            updated_at INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+            PRIMARY KEY (day, staff_id)
+        ) WITHOUT ROWID''',
+        '''INSERT INTO attendance_days
+            (day, staff_id, status, entry_minute, exit_minute, duty_hours, remarks, points, updated_at)
+        SELECT CAST(julianday(a.date) - 2440587.5 AS INTEGER),
+               s.id,
+               CASE a.status WHEN 'present' THEN 1 WHEN 'field_work' THEN 2 WHEN 'absent' THEN 3 ELSE 0 END,
+               time_minutes(a.entry_time),
+               time_minutes(a.exit_time),
+               COALESCE(a.duty_hours, 0),
+               a.remarks,
+               COALESCE(a.points, 0),
+               COALESCE(CAST(strftime('%s', a.timestamp) AS INTEGER), CAST(strftime('%s', 'now') AS INTEGER))
+        FROM attendance a JOIN staff s ON s.name = a.staff_name''',
+        'DROP TABLE attendance',
+        '''CREATE VIEW attendance AS
+        SELECT s.name AS staff_name,
+               date(a.day * 86400, 'unixepoch') AS date,
+               CASE a.status WHEN 1 THEN 'present' WHEN 2 THEN 'field_work' WHEN 3 THEN 'absent' END AS status,
+               CASE WHEN a.entry_minute IS NOT NULL
+                    THEN printf('%02d:%02d', a.entry_minute / 60, a.entry_minute % 60) END AS entry_time,
+               CASE WHEN a.exit_minute IS NOT NULL
+                    THEN printf('%02d:%02d', a.exit_minute / 60, a.exit_minute % 60) END AS exit_time,
+               a.duty_hours,
+               a.remarks,
+               a.points,
+               datetime(a.updated_at, 'unixepoch') AS timestamp
+        FROM attendance_days a JOIN staff s ON s.id = a.staff_id''',
+    ),
+    # 4: per staff per month running totals kept up to date by triggers, so monthly
+    # stats are read rather than summed; hours are in hundredths so they stay exact
+    (
+        '''CREATE TABLE staff_month_totals (
+            month INTEGER NOT NULL,
+            staff_id INTEGER NOT NULL REFERENCES staff (id),
+            total_points INTEGER NOT NULL DEFAULT 0,
+            hours_hundredths INTEGER NOT NULL DEFAULT 0,
+            present_days INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (month, staff_id)
+        ) WITHOUT ROWID''',
+        '''CREATE TRIGGER attendance_days_totals_insert AFTER INSERT ON attendance_days BEGIN
+            INSERT INTO staff_month_totals (month, staff_id, total_points, hours_hundredths, present_days)
+            VALUES (
+                CAST(strftime('%Y%m', NEW.day * 86400, 'unixepoch') AS INTEGER),
+                NEW.staff_id,
+                CASE WHEN NEW.status != 3 THEN NEW.points ELSE 0 END,
+                CASE WHEN NEW.status != 3 THEN CAST(ROUND(NEW.duty_hours * 100) AS INTEGER) ELSE 0 END,
+                NEW.status IN (1, 2)
+            )
+            ON CONFLICT (month, staff_id) DO UPDATE SET
+                total_points = total_points + excluded.total_points,
+                hours_hundredths = hours_hundredths + excluded.hours_hundredths,
+                present_days = present_days + excluded.present_days;
+        END''',
+        '''CREATE TRIGGER attendance_days_totals_delete AFTER DELETE ON attendance_days BEGIN
+            UPDATE staff_month_totals SET
+                total_points = total_points - CASE WHEN OLD.status != 3 THEN OLD.points ELSE 0 END,
+                hours_hundredths = hours_hundredths
+                    - CASE WHEN OLD.status != 3 THEN CAST(ROUND(OLD.duty_hours * 100) AS INTEGER) ELSE 0 END,
+                present_days = present_days - (OLD.status IN (1, 2))
+            WHERE month = CAST(strftime('%Y%m', OLD.day * 86400, 'unixepoch') AS INTEGER)
+              AND staff_id = OLD.staff_id;
+        END''',
+        '''CREATE TRIGGER attendance_days_totals_update AFTER UPDATE OF day, staff_id, status, duty_hours, points
+        ON attendance_days BEGIN
+            UPDATE staff_month_totals SET
+                total_points = total_points - CASE WHEN OLD.status != 3 THEN OLD.points ELSE 0 END,
+                hours_hundredths = hours_hundredths
+                    - CASE WHEN OLD.status != 3 THEN CAST(ROUND(OLD.duty_hours * 100) AS INTEGER) ELSE 0 END,
+                present_days = present_days - (OLD.status IN (1, 2))
+            WHERE month = CAST(strftime('%Y%m', OLD.day * 86400, 'unixepoch') AS INTEGER)
+              AND staff_id = OLD.staff_id;
+            INSERT INTO staff_month_totals (month, staff_id, total_points, hours_hundredths, present_days)
+            VALUES (
+                CAST(strftime('%Y%m', NEW.day * 86400, 'unixepoch') AS INTEGER),
+                NEW.staff_id,
+                CASE WHEN NEW.status != 3 THEN NEW.points ELSE 0 END,
+                CASE WHEN NEW.status != 3 THEN CAST(ROUND(NEW.duty_hours * 100) AS INTEGER) ELSE 0 END,
+                NEW.status IN (1, 2)
+            )
+            ON CONFLICT (month, staff_id) DO UPDATE SET
+                total_points = total_points + excluded.total_points,
+                hours_hundredths = hours_hundredths + excluded.hours_hundredths,
+                present_days = present_days + excluded.present_days;
+        END''',
+        f'INSERT INTO staff_month_totals {MONTH_TOTALS_REBUILD_QUERY}',
+    ),
+    # 5: public holidays (by day number), which are off days like Sundays
+    '''CREATE TABLE IF NOT EXISTS holidays (
+        day INTEGER PRIMARY KEY,
+        name TEXT NOT NULL
+    )''',
+]
+
+# Report queries, kept here so check_query_plans() verifies exactly what the reports run
+# Both select the columns decode_attendance_rows expects, in its order
+DATE_ATTENDANCE_QUERY = '''
+    SELECT staff_id, day, status, entry_minute, exit_minute, duty_hours, points, remarks
+    FROM attendance_days
+    WHERE day = ?
+'''
+
+RANGE_ATTENDANCE_QUERY = '''
+    SELECT staff_id, day, status, entry_minute, exit_minute, duty_hours, points, remarks
+    FROM attendance_days
+    WHERE day BETWEEN ? AND ?
+    ORDER BY day, staff_id
+'''
+
+# Column order of the rows built by build_attendance_rows, and of the same rows once encoded
+ATTENDANCE_ROW_FIELDS = ('staff_name', 'date', 'status', 'entry_time', 'exit_time', 'duty_hours', 'remarks', 'points')
+COMPACT_ROW_FIELDS = ('staff_id', 'day', 'status', 'entry_minute', 'exit_minute', 'duty_hours', 'remarks', 'points')
+
+# Stored rows of a day range in COMPACT_ROW_FIELDS order plus updated_at, compared against before writes
+STORED_ROWS_QUERY = f'''
+    SELECT {", ".join(COMPACT_ROW_FIELDS)}, updated_at
+    FROM attendance_days
+    WHERE day BETWEEN ? AND ?
+'''
+
+# Export rows of a day range; ?3 is a JSON list of staff ids to keep, or NULL for everyone
+EXPORT_QUERY = '''
+    SELECT staff_id, day, status, entry_minute, exit_minute, duty_hours, points, remarks, updated_at
+    FROM attendance_days
+    WHERE day BETWEEN ?1 AND ?2 AND (?3 IS NULL OR staff_id IN (SELECT value FROM json_each(?3)))
+    ORDER BY day, staff_id
+'''
+
+# Staff present or on field work on any of a JSON list of day numbers (a month's Sundays and holidays)
+OFF_DAY_PRESENCE_QUERY = '''
+    SELECT staff_id, COUNT(*)
+    FROM attendance_days
+    WHERE day IN (SELECT value FROM json_each(?)) AND status IN (1, 2)
+    GROUP BY staff_id
+'''
+
+HOLIDAYS_QUERY = '''
+    SELECT day, name
+    FROM holidays
+    WHERE day BETWEEN ? AND ?
+'''
+
+# Upsert updates the row in place instead of REPLACE's delete + insert
+UPSERT_ATTENDANCE_QUERY = '''
+    INSERT INTO attendance_days
+    (staff_id, day, status, entry_minute, exit_minute, duty_hours, remarks, points)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(day, staff_id) DO UPDATE SET
+        status = excluded.status,
+        entry_minute = excluded.entry_minute,
+        exit_minute = excluded.exit_minute,
+        duty_hours = excluded.duty_hours,
+        remarks = excluded.remarks,
+        points = excluded.points,
+        updated_at = CAST(strftime('%s', 'now') AS INTEGER)
+'''
+
+# Offline sync writes carry the time the edit was made instead of the time it arrived
+SYNC_ATTENDANCE_QUERY = '''
+    INSERT INTO attendance_days
+    (staff_id, day, status, entry_minute, exit_minute, duty_hours, remarks, points, updated_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT(day, staff_id) DO UPDATE SET
+        status = excluded.status,
+        entry_minute = excluded.entry_minute,
+        exit_minute = excluded.exit_minute,
+        duty_hours = excluded.duty_hours,
+        remarks = excluded.remarks,
+        points = excluded.points,
+        updated_at = excluded.updated_at
+'''
+
+# Leaderboard in one pass over attendance_days. ?1 is a JSON list of
+# [YYYYMM, first day, last day, working days or null if partial, in period (0/1)] per month,
+# including the month before the period for deltas; ?2 a JSON list of the staff ids to rank;
+# ?3 the period's first day number; ?4 the perfect attendance bonus. Points follow the
+# monthly stats: present and field days count, absences don't, and whole months with
+# presence on every working day earn the bonus. Returns one row per staff member and month.
+LEADERBOARD_QUERY = '''
+    WITH months (month, first_day, last_day, working_days, in_period) AS (
+        SELECT json_extract(value, '$[0]'), json_extract(value, '$[1]'), json_extract(value, '$[2]'),
+               json_extract(value, '$[3]'), json_extract(value, '$[4]')
+        FROM json_each(?1)
+    ),
+    roster (staff_id) AS (
+        SELECT value FROM json_each(?2)
+    ),
+    present AS (
+        SELECT attendance_days.staff_id, attendance_days.day, attendance_days.points, m.month,
+               (attendance_days.day % 7 + 7) % 7 != 3
+                   AND NOT EXISTS (SELECT 1 FROM holidays h WHERE h.day = attendance_days.day) AS working
+        FROM months m
+        JOIN attendance_days ON attendance_days.day BETWEEN m.first_day AND m.last_day
+        WHERE attendance_days.status != 3 AND attendance_days.staff_id IN roster
+    ),
+    monthly AS (
+        SELECT p.staff_id, p.month, COUNT(*) AS present_days,
+               m.working_days > 0 AND SUM(p.working) = m.working_days AS perfect,
+               SUM(p.points) AS points
+        FROM present p JOIN months m ON m.month = p.month
+        GROUP BY p.staff_id, p.month
+    ),
+    runs AS (
+        -- Working days are numbered without Sundays and holidays, so consecutive working
+        -- days present share (working day number - row number): gaps and islands. Day numbers
+        -- are negative before 1970 and SQLite's / and % truncate toward zero, so the Sunday
+        -- count is taken from an offset that keeps the dividend positive
+        SELECT staff_id, day,
+               day - (day + 7000003) / 7
+                   - (SELECT COUNT(*) FROM holidays h WHERE h.day < p.day AND (h.day % 7 + 7) % 7 != 3)
+                   - ROW_NUMBER() OVER (PARTITION BY staff_id ORDER BY day) AS run
+        FROM present p
+        WHERE working AND day >= ?3
+    ),
+    streaks AS (
+        SELECT staff_id, COUNT(*) AS length, MAX(day) AS last_day
+        FROM runs
+        GROUP BY staff_id, run
+    ),
+    staff_streaks AS (
+        -- The current streak is the one reaching the latest working day anyone was present
+        SELECT staff_id, MAX(length) AS longest_streak,
+               MAX(CASE WHEN last_day = (SELECT MAX(day) FROM runs) THEN length ELSE 0 END) AS current_streak
+        FROM streaks
+        GROUP BY staff_id
+    ),
+    grid AS (
+        SELECT r.staff_id, m.month, m.in_period,
+               COALESCE(x.present_days, 0) AS present_days,
+               COALESCE(x.perfect, 0) AS perfect,
+               COALESCE(x.points, 0) + CASE WHEN x.perfect THEN ?4 ELSE 0 END AS points,
+               COALESCE(s.current_streak, 0) AS current_streak,
+               COALESCE(s.longest_streak, 0) AS longest_streak
+        FROM roster r CROSS JOIN months m
+        LEFT JOIN monthly x ON x.staff_id = r.staff_id AND x.month = m.month
+        LEFT JOIN staff_streaks s ON s.staff_id = r.staff_id
+    ),
+    month_ranks AS (
+        SELECT *,
+               RANK() OVER (PARTITION BY month ORDER BY points DESC) AS month_rank,
+               points - LAG(points) OVER staff_months AS delta,
+               SUM(points * in_period) OVER staff_window AS total_points,
+               SUM(present_days * in_period) OVER staff_window AS total_present_days,
+               SUM(perfect * in_period) OVER staff_window AS perfect_months
+        FROM grid
+        WINDOW staff_months AS (PARTITION BY staff_id ORDER BY month),
+               staff_window AS (PARTITION BY staff_id)
+    )
+    SELECT staff_id, month, in_period, points, month_rank, delta,
+           LAG(month_rank) OVER (PARTITION BY staff_id ORDER BY month) - month_rank AS rank_change,
+           RANK() OVER (PARTITION BY month ORDER BY total_points DESC) AS rank,
+           total_points, total_present_days, perfect_months, current_streak, longest_streak
+    FROM month_ranks
+    ORDER BY staff_id, month
+'''
+
+MONTH_TOTALS_QUERY = '''
+    SELECT staff_id, total_points, hours_hundredths, present_days
+    FROM staff_month_totals
+    WHERE month = ?
+'''
+
+BUMP_DATA_VERSION_QUERY = '''
+    INSERT INTO data_versions (period, version, updated_at)
+    VALUES (?, 1, CURRENT_TIMESTAMP)
+    ON CONFLICT(period) DO UPDATE SET
+        version = version + 1,
+        updated_at = CURRENT_TIMESTAMP
+'''
+
+REPORT_QUERIES = {
+    'attendance_for_date': (DATE_ATTENDANCE_QUERY, (10957,)),
+    'attendance_between': (RANGE_ATTENDANCE_QUERY, (10957, 10987)),
+    'stored_rows': (STORED_ROWS_QUERY, (10957, 10987)),
+    'export': (EXPORT_QUERY, (10957, 10987, None)),
+    'export_staff': (EXPORT_QUERY, (10957, 10987, '[1]')),
+    'off_day_presence': (OFF_DAY_PRESENCE_QUERY, ('[10959, 10966]',)),
+    'holidays': (HOLIDAYS_QUERY, (10957, 10987)),
+    'month_totals': (MONTH_TOTALS_QUERY, (202001,)),
+    'month_totals_rebuild': (MONTH_TOTALS_RANGE_REBUILD_QUERY, (10957, 10987)),
+    'leaderboard': (LEADERBOARD_QUERY, ('[[202001, 10957, 10987, 26, 1]]', '[1]', 10957, 20)),
+}
+
+# Tables too big to read in full; a report query that SCANs one of them (even through an index) fails the check
+QUERY_PLAN_TABLES = ('attendance_days', 'staff_month_totals', 'holidays')
+QUERY_PLAN_TABLE_PATTERN = re.compile(rf'\b(?:{"|".join(QUERY_PLAN_TABLES)})\s+(?:AS\s+)?(\w+)', re.IGNORECASE)
+SQL_CLAUSE_WORDS = {'WHERE', 'JOIN', 'LEFT', 'CROSS', 'INNER', 'ON', 'USING', 'GROUP', 'ORDER', 'LIMIT', 'SET', 'AND', 'OR'}
+
 # Database setup
 def init_db():
-    conn = sqlite3.connect('attendance.db')
+    """Create or migrate the database of every branch"""
+    for branch in BRANCHES:
+        with use_branch(branch):
+            init_branch_db()
+
+def init_branch_db():
+    conn = get_db_connection()
+    # WAL lets report reads run while check-in saves are writing
+    conn.execute('PRAGMA journal_mode = WAL')
     cursor = conn.cursor()
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS attendance (
@@ -58,85 +531,451 @@ def init_db():
         )
     ''')
     conn.commit()
-    conn.close()
+    run_migrations(conn)
+    get_staff_ids(conn, sorted(get_staff_members()))
+
+def run_migrations(conn):
+    """Apply pending schema migrations"""
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+        statements = (migration,) if isinstance(migration, str) else migration
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {number}')
+    
+    # Hand space freed by a table rewrite back to the filesystem
+    if len(MIGRATIONS) > version:
+        page_count = conn.execute('PRAGMA page_count').fetchone()[0]
+        if conn.execute('PRAGMA freelist_count').fetchone()[0] * 4 > page_count:
+            conn.execute('VACUUM')
+
+def check_query_plans(conn):
+    """Return report queries whose plan scans a whole QUERY_PLAN_TABLES table instead of searching it"""
+    full_scans = {}
+    for name, (query, params) in REPORT_QUERIES.items():
+        plan = conn.execute(f'EXPLAIN QUERY PLAN {query}', params).fetchall()
+        details = [row[3] for row in plan]
+        # Plans name a table by its alias when it has one
+        tables = set(QUERY_PLAN_TABLES) | {
+            alias for alias in QUERY_PLAN_TABLE_PATTERN.findall(query) if alias.upper() not in SQL_CLAUSE_WORDS
+        }
+        # Key lookups show up as "SEARCH attendance_days USING ..."; any "SCAN attendance_days",
+        # "USING INDEX" or not, reads the whole table or index
+        scans = [detail for detail in details if detail.startswith('SCAN ') and detail.split()[1] in tables]
+        if scans:
+            full_scans[name] = details
+    return full_scans
+
+# Metrics: Prometheus-style histograms exposed at /metrics
+def _escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+class Histogram:
+    """Labelled histogram rendered in the Prometheus text format, safe to share between threads"""
+    
+    def __init__(self, name, help_text, label_names, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+    
+    def observe(self, value, *label_values):
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+    
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for label_values, series in sorted(self._series.items()):
+                labels = ','.join(
+                    f'{name}="{_escape_label_value(value)}"' for name, value in zip(self.label_names, label_values)
+                )
+                prefix = f'{labels},' if labels else ''
+                for bound, count in zip(self.buckets, series['buckets']):
+                    lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {series["count"]}')
+                lines.append(f'{self.name}_sum{{{labels}}} {series["sum"]}')
+                lines.append(f'{self.name}_count{{{labels}}} {series["count"]}')
+        return '\n'.join(lines)
+
+REQUEST_LATENCY = Histogram(
+    'attendance_request_duration_seconds', 'Request latency by route',
+    ('route', 'method', 'status'), METRICS_CONFIG['latency_buckets']
+)
+REQUEST_SQL_STATEMENTS = Histogram(
+    'attendance_request_sql_statements', 'SQL statements executed per request',
+    ('route',), (0, 1, 2, 5, 10, 25, 50, 100)
+)
+SQL_QUERY_LATENCY = Histogram(
+    'attendance_sql_query_duration_seconds', 'SQL statement execution time by operation',
+    ('operation',), METRICS_CONFIG['sql_buckets']
+)
+PDF_BUILD_LATENCY = Histogram(
+    'attendance_pdf_build_seconds', 'Time spent in ReportLab doc.build by report type',
+    ('report',), METRICS_CONFIG['latency_buckets']
+)
+METRICS = [REQUEST_LATENCY, REQUEST_SQL_STATEMENTS, SQL_QUERY_LATENCY, PDF_BUILD_LATENCY]
+
+class InstrumentedConnection(sqlite3.Connection):
+    """sqlite3 connection that counts and times every execute/executemany call"""
+    
+    def _record(self, sql, started):
+        elapsed = time.perf_counter() - started
+        operation = sql.lstrip().split(None, 1)[0].upper() if sql.strip() else 'EMPTY'
+        SQL_QUERY_LATENCY.observe(elapsed, operation)
+        if has_request_context():
+            g.sql_statements = g.get('sql_statements', 0) + 1
+            g.sql_seconds = g.get('sql_seconds', 0.0) + elapsed
+    
+    def execute(self, sql, parameters=()):
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._record(sql, started)
+    
+    def executemany(self, sql, parameters):
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, parameters)
+        finally:
+            self._record(sql, started)
+
+def build_document(doc, story, report):
+    """Run doc.build and record its duration under the report type"""
+    started = time.perf_counter()
+    try:
+        doc.build(story)
+    finally:
+        PDF_BUILD_LATENCY.observe(time.perf_counter() - started, report)
+
+# Branch selected for the current request, report job or CLI command
+_current_branch = contextvars.ContextVar('branch', default=DEFAULT_BRANCH)
+
+def get_current_branch():
+    """Key of the branch the calling code works on"""
+    return _current_branch.get()
+
+@contextlib.contextmanager
+def use_branch(branch):
+    """Switch the database shard and staff list used inside the block"""
+    token = _current_branch.set(branch)
+    try:
+        yield
+    finally:
+        _current_branch.reset(token)
+
+def get_staff_members():
+    """Staff list of the current branch"""
+    return BRANCHES[_current_branch.get()]['staff']
+
+def get_branch_database_path(branch):
+    """Database file of a branch's shard"""
+    return DATABASE_PATH if branch == DEFAULT_BRANCH else BRANCH_DATABASE_PATH.format(branch=branch)
+
+# Per-thread connection pool: each worker thread reuses one tuned connection per shard,
+# so each branch's writes only ever lock that branch's file
+_db_local = threading.local()
 
 def get_db_connection():
-    conn = sqlite3.connect('attendance.db')
-    conn.row_factory = sqlite3.Row
+    """Get the calling thread's pooled connection to the current branch's database"""
+    path = get_branch_database_path(_current_branch.get())
+    connections = getattr(_db_local, 'connections', None)
+    if connections is None:
+        connections = _db_local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=SQLITE_CONFIG['busy_timeout'] / 1000,
+                               factory=InstrumentedConnection)
+        conn.row_factory = sqlite3.Row
+        for pragma, value in SQLITE_CONFIG.items():
+            conn.execute(f'PRAGMA {pragma} = {value}')
+        # Used by the compact schema migration to convert stored 'HH:MM' strings
+        conn.create_function('time_minutes', 1, parse_time_minutes, deterministic=True)
+        conn.staff_ids, conn.staff_names = {}, {}
+        connections[path] = conn
     return conn
 
+def close_db_connection():
+    """Close the calling thread's pooled connections, if it has any"""
+    for conn in getattr(_db_local, 'connections', {}).values():
+        conn.close()
+    _db_local.connections = {}
+
+# Compact schema encoding: the functions below read and write the original text values
+def load_staff(conn):
+    """Reload the connection's staff name <-> id maps from the staff table"""
+    conn.staff_ids = {row['name']: row['id'] for row in conn.execute('SELECT id, name FROM staff')}
+    conn.staff_names = {staff_id: name for name, staff_id in conn.staff_ids.items()}
+
+def get_staff_ids(conn, names):
+    """Map staff names to ids, adding any names the staff table does not have yet"""
+    missing = [name for name in names if name not in conn.staff_ids]
+    if missing:
+        load_staff(conn)
+        missing = [name for name in missing if name not in conn.staff_ids]
+    if missing:
+        with conn:
+            conn.executemany('INSERT OR IGNORE INTO staff (name) VALUES (?)', [(name,) for name in missing])
+        load_staff(conn)
+    return conn.staff_ids
+
+def get_staff_name(conn, staff_id):
+    """Name of a staff id, reloading the map if another connection added the id"""
+    name = conn.staff_names.get(staff_id)
+    if name is None:
+        load_staff(conn)
+        name = conn.staff_names.get(staff_id)
+    return name
+
+@functools.lru_cache(maxsize=8192)
+def encode_day(date_str):
+    """Day number (days since 1970-01-01) of a 'YYYY-MM-DD' string; raises ValueError
+    for anything else, including non-canonical dates such as '2026-1-5'"""
+    date_obj = datetime.strptime(date_str, '%Y-%m-%d').date()
+    if date_obj.isoformat() != date_str:
+        raise ValueError(f"Invalid date: {date_str} (expected YYYY-MM-DD)")
+    return date_obj.toordinal() - EPOCH_ORDINAL
+
+def normalize_date(value):
+    """Canonical 'YYYY-MM-DD' form of a date parameter such as '2026-1-5'; raises ValueError otherwise"""
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date().isoformat()
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid date: {value} (expected YYYY-MM-DD)") from None
+
+@functools.lru_cache(maxsize=8192)
+def decode_day(day):
+    """'YYYY-MM-DD' string of a day number"""
+    return datetime.fromordinal(day + EPOCH_ORDINAL).strftime('%Y-%m-%d')
+
+def decode_minutes(minutes):
+    """'HH:MM' string of minutes since midnight, None stays None"""
+    return None if minutes is None else TIME_LABELS[minutes]
+
+@functools.lru_cache(maxsize=4096)
+def decode_timestamp(seconds):
+    """Stored Unix time as the 'YYYY-MM-DD HH:MM:SS' UTC text CURRENT_TIMESTAMP used to give"""
+    return None if seconds is None else datetime.fromtimestamp(seconds, timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+def query_rows(conn, query, params=()):
+    """Run a query whose rows come back as plain tuples instead of sqlite3.Row"""
+    cursor = conn.execute(query, params)
+    cursor.row_factory = None
+    return cursor
+
+def decode_attendance_rows(conn, rows):
+    """Decode attendance_days rows (RANGE_ATTENDANCE_QUERY columns) into dicts with the original values"""
+    staff_names = conn.staff_names
+    return [
+        {
+            'staff_name': staff_names.get(staff_id) or get_staff_name(conn, staff_id),
+            'date': decode_day(day),
+            'status': STATUS_NAMES.get(status),
+            'entry_time': None if entry_minute is None else TIME_LABELS[entry_minute],
+            'exit_time': None if exit_minute is None else TIME_LABELS[exit_minute],
+            'duty_hours': duty_hours,
+            'points': points,
+            'remarks': remarks
+        }
+        for staff_id, day, status, entry_minute, exit_minute, duty_hours, points, remarks in rows
+    ]
+
+def encode_attendance_rows(conn, rows):
+    """Encode rows built by build_attendance_rows for the attendance_days table"""
+    staff_ids = get_staff_ids(conn, {row[0] for row in rows})
+    return [
+        (staff_ids[staff_name], encode_day(date_str), STATUS_CODES.get(status, 0),
+         parse_time_minutes(entry_time), parse_time_minutes(exit_time), duty_hours, remarks, points)
+        for staff_name, date_str, status, entry_time, exit_time, duty_hours, remarks, points in rows
+    ]
+
 def is_sunday(date_str):
     """Check if given date is Sunday"""
-    date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-    return date_obj.weekday() == 6  # 6 is Sunday
+    # Day 0 (1970-01-01) was a Thursday, so Sundays are the days with day % 7 == 3
+    return encode_day(date_str) % 7 == 3
+
+@functools.lru_cache(maxsize=4096)
+def parse_time_minutes(time_str):
+    """Parse an 'HH:MM' string into minutes since midnight, None if missing or invalid"""
+    if not time_str:
+        return None
+    match = TIME_PATTERN.match(time_str)
+    if not match:
+        return None
+    hours, minutes = int(match.group(1)), int(match.group(2))
+    if hours > 23 or minutes > 59:
+        return None
+    return hours * 60 + minutes
+
+def calculate_duty_points(duty_hours):
+    """Points earned for the length of an office day, including overtime"""
+    points = 0
+    
+    # Base attendance points
+    if duty_hours >= FULL_DAY_HOURS:
+        points += POINTS_CONFIG['full_day_present']
+    elif duty_hours >= HALF_DAY_HOURS:
+        points += POINTS_CONFIG['half_day_present']
+    
+    # Overtime points
+    if duty_hours > FULL_DAY_HOURS:
+        overtime_hours = duty_hours - FULL_DAY_HOURS
+        points += int(overtime_hours * POINTS_CONFIG['overtime'])
+    
+    return points
+
+def calculate_arrival_points(entry_minutes):
+    """Points for arriving early or late, 0 if the entry time is unknown"""
+    if entry_minutes is None:
+        return 0
+    if entry_minutes <= EARLY_ARRIVAL_MINUTES:
+        return POINTS_CONFIG['early_arrival']
+    if entry_minutes > LATE_ARRIVAL_MINUTES:
+        return POINTS_CONFIG['late_arrival']
+    return 0
+
+def refresh_points_engine():
+    """Precompute thresholds and per-duration lookup tables from the config dicts.
+    
+    Call again after changing POINTS_CONFIG or THRESHOLDS_CONFIG at runtime.
+    """
+    global EARLY_ARRIVAL_MINUTES, LATE_ARRIVAL_MINUTES, FULL_DAY_HOURS, HALF_DAY_HOURS
+    global DUTY_HOURS_BY_MINUTES, DUTY_POINTS_BY_MINUTES, ARRIVAL_POINTS_BY_MINUTES, _batch_scoring
+    
+    EARLY_ARRIVAL_MINUTES = parse_time_minutes(THRESHOLDS_CONFIG['early_arrival'])
+    LATE_ARRIVAL_MINUTES = parse_time_minutes(THRESHOLDS_CONFIG['late_arrival'])
+    FULL_DAY_HOURS = THRESHOLDS_CONFIG['full_day_hours']
+    HALF_DAY_HOURS = THRESHOLDS_CONFIG['half_day_hours']
+    
+    # A shift is at most 23:59 long, so hours and points can be looked up by its length in minutes
+    DUTY_HOURS_BY_MINUTES = [round(minutes / 60, 2) for minutes in range(MINUTES_PER_DAY)]
+    DUTY_POINTS_BY_MINUTES = [calculate_duty_points(hours) for hours in DUTY_HOURS_BY_MINUTES]
+    ARRIVAL_POINTS_BY_MINUTES = [calculate_arrival_points(minutes) for minutes in range(MINUTES_PER_DAY)]
+    
+    # Rebuilt from the new tables on the next batch
+    _batch_scoring = None
+
+# numpy and the lookup tables as arrays for score_attendance_batch, loaded on the first
+# batch rather than at import (False once numpy turned out to be missing)
+_batch_scoring = None
+_batch_scoring_lock = threading.Lock()
+
+refresh_points_engine()
+
+def get_batch_scoring():
+    """numpy and the points lookup tables as arrays, or None without numpy"""
+    global _batch_scoring
+    if _batch_scoring is None:
+        with _batch_scoring_lock:
+            if _batch_scoring is None:
+                try:
+                    import numpy as np
+                except ImportError:  # Batch scoring falls back to plain Python loops
+                    _batch_scoring = False
+                else:
+                    _batch_scoring = SimpleNamespace(
+                        np=np,
+                        duty_hours=np.array(DUTY_HOURS_BY_MINUTES, dtype=np.float64),
+                        duty_points=np.array(DUTY_POINTS_BY_MINUTES, dtype=np.int64),
+                        arrival_points=np.array(ARRIVAL_POINTS_BY_MINUTES, dtype=np.int64)
+                    )
+    return _batch_scoring or None
 
 def calculate_duty_hours(entry_time, exit_time):
     """Calculate duty hours between entry and exit time"""
-    if not entry_time or not exit_time:
+    entry = parse_time_minutes(entry_time)
+    exit = parse_time_minutes(exit_time)
+    if entry is None or exit is None:
         return 0
     
-    try:
-        entry = datetime.strptime(entry_time, '%H:%M')
-        exit = datetime.strptime(exit_time, '%H:%M')
-        
-        # Handle overnight shifts
-        if exit < entry:
-            exit += timedelta(days=1)
-        
-        duration = exit - entry
-        hours = duration.total_seconds() / 3600
-        return round(hours, 2)
-    except:
-        return 0
+    # Handle overnight shifts
+    return round(((exit - entry) % MINUTES_PER_DAY) / 60, 2)
 
 def calculate_points(status, entry_time, exit_time, duty_hours, date_str):
     """Calculate points based on attendance and performance"""
-    points = 0
-    
     if status == 'absent':
-        points += POINTS_CONFIG['absent']
-        return points
+        return POINTS_CONFIG['absent']
     
     if status == 'field_work':
-        points += POINTS_CONFIG['field_work']
-        return points
+        return POINTS_CONFIG['field_work']
     
     if status == 'present':
-        # Base attendance points
-        if duty_hours >= 7.5:
-            points += POINTS_CONFIG['full_day_present']
-        elif duty_hours >= 4:
-            points += POINTS_CONFIG['half_day_present']
-        
-        # Timing-based points
-        if entry_time:
-            try:
-                entry = datetime.strptime(entry_time, '%H:%M').time()
-                early_time = datetime.strptime('10:00', '%H:%M').time()
-                late_time = datetime.strptime('10:30', '%H:%M').time()
-                
-                if entry <= early_time:
-                    points += POINTS_CONFIG['early_arrival']
-                elif entry > late_time:
-                    points += POINTS_CONFIG['late_arrival']
-            except:
-                pass
-        
-        # Overtime points
-        if duty_hours > 7.5:
-            overtime_hours = duty_hours - 7.5
-            points += int(overtime_hours * POINTS_CONFIG['overtime'])
+        return calculate_duty_points(duty_hours) + calculate_arrival_points(parse_time_minutes(entry_time))
     
-    return points
+    return 0
+
+def score_attendance_batch(statuses, entry_times, exit_times):
+    """Score many records in one pass; returns (duty_hours, points) lists.
+    
+    Gives the same results as calculate_duty_hours/calculate_points per record,
+    with field work counted as a 7.5 hour day as in save_attendance.
+    """
+    return score_minutes_batch(
+        [STATUS_CODES.get(status, 0) for status in statuses],
+        [parse_time_minutes(entry_time) for entry_time in entry_times],
+        [parse_time_minutes(exit_time) for exit_time in exit_times]
+    )
+
+def score_minutes_batch(status_codes, entry_minutes, exit_minutes):
+    """score_attendance_batch for stored values: status codes and minutes since midnight (or None)"""
+    present, field_work, absent = STATUS_CODES['present'], STATUS_CODES['field_work'], STATUS_CODES['absent']
+    scoring = get_batch_scoring()
+    if scoring is None:
+        duty_hours, points = [], []
+        for status, entry, exit in zip(status_codes, entry_minutes, exit_minutes):
+            duration = 0 if entry is None or exit is None else (exit - entry) % MINUTES_PER_DAY
+            if status == field_work:
+                duty_hours.append(FIELD_WORK_HOURS)
+                points.append(POINTS_CONFIG['field_work'])
+                continue
+            duty_hours.append(DUTY_HOURS_BY_MINUTES[duration])
+            if status == absent:
+                points.append(POINTS_CONFIG['absent'])
+            elif status == present:
+                arrival = 0 if entry is None else ARRIVAL_POINTS_BY_MINUTES[entry]
+                points.append(DUTY_POINTS_BY_MINUTES[duration] + arrival)
+            else:
+                points.append(0)
+        return duty_hours, points
+    
+    np = scoring.np
+    count = len(status_codes)
+    statuses = np.fromiter(status_codes, dtype=np.int64, count=count)
+    # Missing times become -1
+    entry = np.fromiter((-1 if m is None else m for m in entry_minutes), dtype=np.int64, count=count)
+    exit = np.fromiter((-1 if m is None else m for m in exit_minutes), dtype=np.int64, count=count)
+    has_times = (entry >= 0) & (exit >= 0)
+    duration = np.where(has_times, (exit - entry) % MINUTES_PER_DAY, 0)
+    
+    is_present = statuses == present
+    is_field_work = statuses == field_work
+    is_absent = statuses == absent
+    
+    arrival = np.where(entry >= 0, scoring.arrival_points[np.maximum(entry, 0)], 0)
+    duty_hours = np.where(is_field_work, FIELD_WORK_HOURS, scoring.duty_hours[duration])
+    points = np.select(
+        [is_absent, is_field_work, is_present],
+        [POINTS_CONFIG['absent'], POINTS_CONFIG['field_work'], scoring.duty_points[duration] + arrival],
+        0
+    )
+    return duty_hours.tolist(), points.tolist()
 
 def get_attendance_for_date(date_str):
     """Get attendance for a specific date"""
     conn = get_db_connection()
-    attendance = conn.execute(
-        'SELECT staff_name, status, entry_time, exit_time, duty_hours, remarks, points FROM attendance WHERE date = ?',
-        (date_str,)
-    ).fetchall()
-    conn.close()
+    attendance = decode_attendance_rows(conn, query_rows(conn, DATE_ATTENDANCE_QUERY, (encode_day(date_str),)))
     
     # Convert to dictionary
     attendance_dict = {}
@@ -151,60 +990,529 @@ def get_attendance_for_date(date_str):
         }
     return attendance_dict
 
-def save_attendance(date_str, attendance_data):
-    """Save attendance data for a date"""
-    conn = get_db_connection()
+def build_attendance_rows(attendance_by_date):
+    """Compute hours and points for {date: {staff_name: data}} and return database rows"""
+    entries = [
+        (date_str, staff_name, data)
+        for date_str, attendance_data in attendance_by_date.items()
+        for staff_name, data in attendance_data.items()
+    ]
+    duty_hours, points = score_attendance_batch(
+        [data.get('status') for _, _, data in entries],
+        [data.get('entry_time') for _, _, data in entries],
+        [data.get('exit_time') for _, _, data in entries]
+    )
     
-    for staff_name, data in attendance_data.items():
-        # Calculate duty hours - field work gets automatic 7.5 hours
-        if data.get('status') == 'field_work':
-            duty_hours = 7.5
-        else:
-            duty_hours = calculate_duty_hours(data.get('entry_time'), data.get('exit_time'))
-        
-        # Calculate points
-        points = calculate_points(
-            data.get('status'),
-            data.get('entry_time'),
-            data.get('exit_time'),
-            duty_hours,
-            date_str
-        )
-        
-        conn.execute('''
-            INSERT OR REPLACE INTO attendance 
-            (staff_name, date, status, entry_time, exit_time, duty_hours, remarks, points) 
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
+    rows = []
+    for (date_str, staff_name, data), hours, entry_points in zip(entries, duty_hours, points):
+        rows.append((
             staff_name,
             date_str,
             data.get('status'),
             data.get('entry_time') if data.get('status') == 'present' else None,
             data.get('exit_time') if data.get('status') == 'present' else None,
-            duty_hours,
+            hours,
             data.get('remarks'),
-            points
+            entry_points
         ))
+    return rows
+
+def save_attendance(date_str, attendance_data):
+    """Save attendance data for a date, skipping staff whose entry did not change"""
+    return save_attendance_bulk({date_str: attendance_data}, skip_unchanged=True)
+
+def save_attendance_bulk(attendance_by_date, skip_unchanged=False):
+    """Save attendance for many dates ({date: {staff_name: data}}) in one transaction"""
+    rows = build_attendance_rows(attendance_by_date)
+    return write_attendance_rows(rows, skip_unchanged)
+
+def save_staff_attendance(date_str, staff_name, data):
+    """Save one staff member's entry for a date; returns (changed, stored row as a dict)"""
+    rows = build_attendance_rows({date_str: {staff_name: data}})
+    changed = write_attendance_rows(rows, skip_unchanged=True) > 0
+    return changed, dict(zip(ATTENDANCE_ROW_FIELDS, rows[0]))
+
+def filter_changed_rows(conn, rows):
+    """Drop encoded rows identical to what is already stored"""
+    days = [row[1] for row in rows]
+    stored = {
+        # Compared without updated_at
+        (record['staff_id'], record['day']): tuple(record)[:-1]
+        for record in conn.execute(STORED_ROWS_QUERY, (min(days), max(days)))
+    }
+    return [row for row in rows if stored.get((row[0], row[1])) != row]
+
+def write_attendance_rows(rows, skip_unchanged=False):
+    """Upsert computed attendance rows in one transaction; returns the number written"""
+    if not rows:
+        return 0
     
-    conn.commit()
-    conn.close()
+    conn = get_db_connection()
+    rows = encode_attendance_rows(conn, rows)
+    # The pooled connection outlives this call, so commit or roll back explicitly
+    with conn:
+        # Take the write lock up front rather than upgrading mid-transaction
+        conn.execute('BEGIN IMMEDIATE')
+        if skip_unchanged:
+            rows = filter_changed_rows(conn, rows)
+        if not rows:
+            return 0
+        conn.executemany(UPSERT_ATTENDANCE_QUERY, rows)
+        touched_dates = {decode_day(row[1]) for row in rows}
+        bump_data_versions(conn, get_touched_periods(touched_dates))
+    
+    invalidate_monthly_stats({(int(date_str[:4]), int(date_str[5:7])) for date_str in touched_dates})
+    return len(rows)
 
-def get_monthly_stats(year, month):
-    """Get monthly statistics for all staff"""
+def validate_sync_change(change):
+    """Error message for an unusable offline edit, or None"""
+    if not isinstance(change, dict):
+        return 'Each change must be an object'
+    date_str = change.get('date')
+    try:
+        if not is_working_day(date_str):
+            return f'{date_str} is not a working day'
+    except (TypeError, ValueError):
+        return 'A valid date (YYYY-MM-DD) is required'
+    if change.get('staff_name') not in get_staff_members():
+        return f"Unknown staff member: {change.get('staff_name')}"
+    if change.get('status') not in ATTENDANCE_STATUSES:
+        return f"Unknown status: {change.get('status')}"
+    if isinstance(change.get('updated_at'), bool) or not isinstance(change.get('updated_at'), (int, float)):
+        return 'updated_at (Unix seconds) is required'
+    return None
+
+def sync_attendance(changes, sent_at=None):
+    """Apply queued offline edits and return one result dict per change, in order.
+    
+    Each change is {date, staff_name, status, entry_time, exit_time, remarks,
+    updated_at}, where updated_at is when the edit was made on the client (Unix
+    seconds). sent_at is the client's clock when it sent the batch and corrects
+    for clock skew. An edit older than the stored row's updated_at loses to it
+    and comes back as a conflict with the stored record.
+    """
+    now = int(time.time())
+    offset = now - int(sent_at) if isinstance(sent_at, (int, float)) and not isinstance(sent_at, bool) else 0
+    results = [None] * len(changes)
+    latest = {}
+    for index, change in enumerate(changes):
+        error = validate_sync_change(change)
+        if error is not None:
+            results[index] = {'result': 'rejected', 'error': error}
+            continue
+        edit_time = min(int(change['updated_at']) + offset, now)
+        key = (change['date'], change['staff_name'])
+        # Only the newest edit of a row in the batch is applied
+        if key in latest:
+            if latest[key][0] > edit_time:
+                results[index] = {'result': 'superseded'}
+                continue
+            results[latest[key][1]] = {'result': 'superseded'}
+        status = change['status']
+        latest[key] = (edit_time, index, {
+            'status': status,
+            'entry_time': change.get('entry_time') if status == 'present' else None,
+            'exit_time': change.get('exit_time') if status == 'present' else None,
+            'remarks': change.get('remarks') or ''
+        })
+    
+    if latest:
+        attendance_by_date = {}
+        for (date_str, staff_name), (_, _, data) in latest.items():
+            attendance_by_date.setdefault(date_str, {})[staff_name] = data
+        conn = get_db_connection()
+        rows = encode_attendance_rows(conn, build_attendance_rows(attendance_by_date))
+        
+        written = []
+        with conn:
+            conn.execute('BEGIN IMMEDIATE')
+            days = [row[1] for row in rows]
+            stored = {
+                (record[0], record[1]): record
+                for record in query_rows(conn, STORED_ROWS_QUERY, (min(days), max(days)))
+            }
+            outcomes = {}
+            for row in rows:
+                date_str = decode_day(row[1])
+                edit_time = latest[(date_str, conn.staff_names[row[0]])][0]
+                current = stored.get((row[0], row[1]))
+                if current is not None and current[:8] == row:
+                    outcomes[row[:2]] = ('unchanged', current)
+                elif current is not None and current[8] > edit_time:
+                    outcomes[row[:2]] = ('conflict', current)
+                else:
+                    written.append(row + (edit_time,))
+                    outcomes[row[:2]] = ('saved', written[-1])
+            touched_dates = {decode_day(row[1]) for row in written}
+            if written:
+                conn.executemany(SYNC_ATTENDANCE_QUERY, written)
+                bump_data_versions(conn, get_touched_periods(touched_dates))
+        
+        if touched_dates:
+            invalidate_monthly_stats({(int(date_str[:4]), int(date_str[5:7])) for date_str in touched_dates})
+        for (date_str, staff_name), (_, index, _) in latest.items():
+            outcome, record = outcomes[(conn.staff_ids[staff_name], encode_day(date_str))]
+            results[index] = {'result': outcome, 'record': decode_sync_record(record)}
+    
+    for change, result in zip(changes, results):
+        if isinstance(change, dict):
+            result.update(date=change.get('date'), staff_name=change.get('staff_name'))
+    return results
+
+def decode_sync_record(record):
+    """Stored state of an attendance_days row (COMPACT_ROW_FIELDS plus updated_at) for sync results"""
+    _, _, status, entry_minute, exit_minute, duty_hours, remarks, points, updated_at = record
+    return {
+        'status': STATUS_NAMES.get(status),
+        'entry_time': decode_minutes(entry_minute) or '',
+        'exit_time': decode_minutes(exit_minute) or '',
+        'duty_hours': duty_hours,
+        'remarks': remarks or '',
+        'points': points,
+        'updated_at': updated_at
+    }
+
+def rescore_attendance(start_date=None, end_date=None):
+    """Recalculate hours and points for stored rows, e.g. after a POINTS_CONFIG change"""
+    refresh_points_engine()
+    conn = get_db_connection()
+    query = 'SELECT day, staff_id, status, entry_minute, exit_minute, duty_hours, points FROM attendance_days'
+    params = ()
+    if start_date and end_date:
+        query += ' WHERE day BETWEEN ? AND ?'
+        params = (encode_day(start_date), encode_day(end_date))
+    records = query_rows(conn, query, params).fetchall()
+    if not records:
+        return 0
+    
+    days, staff_ids, statuses, entry_minutes, exit_minutes, old_hours, old_points = zip(*records)
+    duty_hours, points = score_minutes_batch(statuses, entry_minutes, exit_minutes)
+    changed = [
+        (hours, row_points, day, staff_id)
+        for day, staff_id, old_row_hours, old_row_points, hours, row_points
+        in zip(days, staff_ids, old_hours, old_points, duty_hours, points)
+        if hours != old_row_hours or row_points != old_row_points
+    ]
+    if not changed:
+        return 0
+    
+    changed_days = {row[2] for row in changed}
+    first = datetime.fromordinal(min(changed_days) + EPOCH_ORDINAL).replace(day=1)
+    last = datetime.fromordinal(max(changed_days) + EPOCH_ORDINAL)
+    last = last.replace(day=calendar.monthrange(last.year, last.month)[1])
+    
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        # The update trigger would adjust staff_month_totals once per row; it is dropped for the
+        # bulk update and the months touched are rebuilt with one grouped query instead
+        trigger_sql = conn.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'trigger' AND name = 'attendance_days_totals_update'"
+        ).fetchone()[0]
+        conn.execute('DROP TRIGGER attendance_days_totals_update')
+        conn.executemany('UPDATE attendance_days SET duty_hours = ?, points = ? WHERE day = ? AND staff_id = ?',
+                         changed)
+        conn.execute(trigger_sql)
+        conn.execute('DELETE FROM staff_month_totals WHERE month BETWEEN ? AND ?',
+                     (first.year * 100 + first.month, last.year * 100 + last.month))
+        conn.execute(f'INSERT INTO staff_month_totals {MONTH_TOTALS_RANGE_REBUILD_QUERY}',
+                     (first.toordinal() - EPOCH_ORDINAL, last.toordinal() - EPOCH_ORDINAL))
+        bump_data_versions(conn, get_touched_periods(decode_day(day) for day in changed_days))
+    
+    invalidate_monthly_stats()
+    return len(changed)
+
+def parse_punch_timestamp(value):
+    """Parse a device timestamp into a datetime, or None if no known format matches"""
+    value = (value or '').strip()
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        pass
+    for timestamp_format in PUNCH_TIMESTAMP_FORMATS:
+        try:
+            return datetime.strptime(value, timestamp_format)
+        except ValueError:
+            continue
+    return None
+
+def find_punch_column(fieldnames, aliases):
+    """Return the header in fieldnames matching one of aliases (case-insensitive), or None"""
+    normalized = {name.strip().lower(): name for name in fieldnames if name}
+    for alias in aliases:
+        if alias in normalized:
+            return normalized[alias]
+    return None
+
+def pair_punches(lines):
+    """Stream a punch log CSV and pair each person's first and last punch per day.
+    
+    Returns ({(date_str, staff_name): [first_minutes, last_minutes, punch_count, line]},
+    line count, rejected rows). Only one pair per person-day is held in memory.
+    """
+    import csv  # Only punch imports and CSV exports need it, so it isn't loaded at startup
+
+    reader = csv.DictReader(lines)
+    fieldnames = reader.fieldnames or []
+    name_column = find_punch_column(fieldnames, PUNCH_LOG_COLUMNS['name'])
+    timestamp_column = find_punch_column(fieldnames, PUNCH_LOG_COLUMNS['timestamp'])
+    date_column = find_punch_column(fieldnames, PUNCH_LOG_COLUMNS['date'])
+    time_column = find_punch_column(fieldnames, PUNCH_LOG_COLUMNS['time'])
+    if name_column is None or (timestamp_column is None and (date_column is None or time_column is None)):
+        raise ValueError('Punch log needs a name column and either a timestamp column or date and time columns')
+    
+    staff_by_key = {name.casefold(): name for name in get_staff_members()}
+    # Day off reason (None for a working day) per date, so the calendar is checked once a date
+    day_off_reasons = {}
+    days = {}
+    rejected = []
+    line_count = 0
+    # Line 1 is the header
+    for line_number, record in enumerate(reader, start=2):
+        line_count += 1
+        staff_name = staff_by_key.get((record.get(name_column) or '').strip().casefold())
+        if timestamp_column is not None:
+            punched_at = parse_punch_timestamp(record.get(timestamp_column))
+        else:
+            punched_at = parse_punch_timestamp(f"{record.get(date_column) or ''} {record.get(time_column) or ''}")
+        
+        if staff_name is None:
+            rejected.append({'line': line_number, 'reason': f'Unknown staff member: {record.get(name_column)}'})
+            continue
+        if punched_at is None:
+            rejected.append({'line': line_number, 'reason': 'Unreadable punch time'})
+            continue
+        date_str = punched_at.date().isoformat()
+        if date_str not in day_off_reasons:
+            day_off_reasons[date_str] = get_day_off_reason(date_str)
+        if day_off_reasons[date_str] is not None:
+            rejected.append({'line': line_number, 'reason': f'{date_str} is not a working day ({day_off_reasons[date_str]})'})
+            continue
+        
+        minutes = punched_at.hour * 60 + punched_at.minute
+        key = (date_str, staff_name)
+        day = days.get(key)
+        if day is None:
+            days[key] = [minutes, minutes, 1, line_number]
+        else:
+            day[0] = min(day[0], minutes)
+            day[1] = max(day[1], minutes)
+            day[2] += 1
+    return days, line_count, rejected
+
+def load_stored_remarks(conn, start_date, end_date):
+    """Map (staff_name, date) to stored remarks so imports do not wipe them"""
+    return {
+        (get_staff_name(conn, row['staff_id']), decode_day(row['day'])): row['remarks']
+        for row in conn.execute(
+            'SELECT staff_id, day, remarks FROM attendance_days WHERE day BETWEEN ? AND ?',
+            (encode_day(start_date), encode_day(end_date))
+        )
+    }
+
+def import_punch_log(lines):
+    """Import a biometric punch log (an iterable of CSV lines) as present days.
+    
+    Days are scored and written in batches of PUNCH_IMPORT_BATCH_SIZE rows, each in
+    its own transaction; bad lines and single-punch days are reported, not fatal.
+    """
+    days, line_count, rejected = pair_punches(lines)
+    
+    attendance = []
+    for (date_str, staff_name), (first, last, punch_count, line_number) in sorted(days.items()):
+        if punch_count < 2 or first == last:
+            rejected.append({'line': line_number, 'reason': f'Only one punch for {staff_name} on {date_str}'})
+            continue
+        attendance.append((date_str, staff_name, {
+            'status': 'present',
+            'entry_time': f'{first // 60:02d}:{first % 60:02d}',
+            'exit_time': f'{last // 60:02d}:{last % 60:02d}'
+        }))
+    
     conn = get_db_connection()
+    written = 0
+    for start in range(0, len(attendance), PUNCH_IMPORT_BATCH_SIZE):
+        batch = attendance[start:start + PUNCH_IMPORT_BATCH_SIZE]
+        remarks = load_stored_remarks(conn, batch[0][0], batch[-1][0])
+        attendance_by_date = {}
+        for date_str, staff_name, data in batch:
+            data['remarks'] = remarks.get((staff_name, date_str)) or ''
+            attendance_by_date.setdefault(date_str, {})[staff_name] = data
+        written += write_attendance_rows(build_attendance_rows(attendance_by_date), skip_unchanged=True)
+    
+    rejected.sort(key=lambda item: item['line'])
+    return {
+        'lines': line_count,
+        'days': len(attendance),
+        'written': written,
+        'unchanged': len(attendance) - written,
+        'rejected_count': len(rejected),
+        'rejected': rejected[:PUNCH_IMPORT_MAX_REJECTED]
+    }
+
+def get_month_bounds(year, month):
+    """Get first and last date strings (YYYY-MM-DD) of a month"""
+    last_day = calendar.monthrange(year, month)[1]
+    return f'{year}-{month:02d}-01', f'{year}-{month:02d}-{last_day:02d}'
+
+def get_month_version(year, month):
+    """Data version of a month; every write to the month bumps it, from any process"""
+    row = query_rows(get_db_connection(), 'SELECT version FROM data_versions WHERE period = ?',
+                     (f'month:{year}-{month:02d}',)).fetchone()
+    return 0 if row is None else row[0]
+
+def get_holidays_version():
+    """Data version of the holidays table, bumped only by holiday changes (from any process).
     
-    # Get all attendance records for the month
-    records = conn.execute('''
-        SELECT staff_name, status, duty_hours, points, date
-        FROM attendance 
-        WHERE date LIKE ? AND status != 'absent'
-        ORDER BY staff_name, date
-    ''', (f'{year}-{month:02d}-%',)).fetchall()
+    Read once per request; outside a request every call reads it.
+    """
+    branch = get_current_branch()
+    versions = g.setdefault('holidays_versions', {}) if has_request_context() else {}
+    if branch not in versions:
+        row = query_rows(get_db_connection(), 'SELECT version FROM data_versions WHERE period = ?',
+                         ('holidays',)).fetchone()
+        versions[branch] = 0 if row is None else row[0]
+    return versions[branch]
+
+# Working-day calendar: per (branch, year, month), the working days (not Sundays or
+# holidays) as a tuple and a set, plus the month's holidays. Entries remember the holidays
+# version, so a holiday saved by another worker process is picked up too, while attendance
+# writes leave them alone
+_calendar_cache = {}
+_calendar_lock = threading.Lock()
+
+def get_month_calendar(year, month):
+    """Get (working days tuple, working days frozenset, {date: holiday name}) for a month"""
+    key = (get_current_branch(), year, month)
+    version = get_holidays_version()
+    entry = _calendar_cache.get(key)
+    if entry is not None and entry[0] == version:
+        return entry[1]
     
-    conn.close()
+    first_day = encode_day(f'{year}-{month:02d}-01')
+    last_day = first_day + calendar.monthrange(year, month)[1] - 1
+    holidays = {
+        decode_day(day): name
+        for day, name in query_rows(get_db_connection(), HOLIDAYS_QUERY, (first_day, last_day))
+    }
+    working_days = tuple(
+        date_str for date_str in map(decode_day, range(first_day, last_day + 1))
+        if not is_sunday(date_str) and date_str not in holidays
+    )
+    month_calendar = (working_days, frozenset(working_days), holidays)
+    with _calendar_lock:
+        _calendar_cache[key] = (version, month_calendar)
+    return month_calendar
+
+def invalidate_calendar(months=None):
+    """Forget the current branch's calendar for the given (year, month) pairs, or every cached month"""
+    branch = get_current_branch()
+    with _calendar_lock:
+        if months is None:
+            _calendar_cache.clear()
+            return
+        for year, month in months:
+            _calendar_cache.pop((branch, year, month), None)
+
+def get_working_days(year, month):
+    """Get all working days (not Sundays or holidays) of a month as date strings"""
+    return get_month_calendar(year, month)[0]
+
+def is_working_day(date_str):
+    """Check if a 'YYYY-MM-DD' date is a working day; raises ValueError for an invalid date"""
+    encode_day(date_str)
+    return date_str in get_month_calendar(int(date_str[:4]), int(date_str[5:7]))[1]
+
+def get_day_off_reason(date_str):
+    """Why a date is not a working day ('Sunday' or the holiday's name), None for a working day"""
+    if is_working_day(date_str):
+        return None
+    if is_sunday(date_str):
+        return 'Sunday'
+    return get_month_calendar(int(date_str[:4]), int(date_str[5:7]))[2].get(date_str, 'Holiday')
+
+def get_holidays(year):
+    """Get {date: name} of a year's holidays"""
+    holidays = {}
+    for month in range(1, 13):
+        holidays.update(get_month_calendar(year, month)[2])
+    return holidays
+
+def set_holiday(date_str, name=None):
+    """Add or rename a holiday, or remove it when name is None; reports of that month are invalidated"""
+    day = encode_day(date_str)
+    conn = get_db_connection()
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        if name is None:
+            conn.execute('DELETE FROM holidays WHERE day = ?', (day,))
+        else:
+            conn.execute('INSERT INTO holidays (day, name) VALUES (?, ?) ON CONFLICT(day) DO UPDATE SET name = excluded.name',
+                         (day, name))
+        bump_data_versions(conn, get_touched_periods({date_str}) | {'holidays'})
     
+    if has_request_context():
+        g.pop('holidays_versions', None)
+    month = {(int(date_str[:4]), int(date_str[5:7]))}
+    invalidate_calendar(month)
+    invalidate_monthly_stats(month)
+
+def count_off_day_presence(year, month):
+    """Get {staff: days present or on field work on a Sunday or holiday} for a month"""
+    working_days = get_month_calendar(year, month)[1]
+    first_day = encode_day(f'{year}-{month:02d}-01')
+    off_days = [
+        day for day in range(first_day, first_day + calendar.monthrange(year, month)[1])
+        if decode_day(day) not in working_days
+    ]
+    conn = get_db_connection()
+    rows = query_rows(conn, OFF_DAY_PRESENCE_QUERY, (json.dumps(off_days),))
+    return {get_staff_name(conn, staff_id): count for staff_id, count in rows}
+
+def get_attendance_between(start_date, end_date):
+    """Get every attendance row between two dates (inclusive) as a primary key range scan"""
+    conn = get_db_connection()
+    records = query_rows(conn, RANGE_ATTENDANCE_QUERY, (encode_day(start_date), encode_day(end_date)))
+    return decode_attendance_rows(conn, records)
+
+def load_month_attendance(year, month):
+    """Load every attendance row of a month with a single range query"""
+    first_date, last_date = get_month_bounds(year, month)
+    return get_attendance_between(first_date, last_date)
+
+def build_daily_records(records, working_days):
+    """Group month rows into {date: {staff_name: data}} for the given days"""
+    attendance_records = {day: {} for day in working_days}
+    for row in records:
+        day_attendance = attendance_records.get(row['date'])
+        if day_attendance is None:
+            continue
+        day_attendance[row['staff_name']] = {
+            'status': row['status'],
+            'entry_time': row['entry_time'],
+            'exit_time': row['exit_time'],
+            'duty_hours': row['duty_hours'],
+            'points': row['points'],
+            'remarks': row['remarks']
+        }
+    return attendance_records
+
+def get_performance_grade(total_points):
+    """Grade a month's points total"""
+    if total_points >= 200:
+        return 'Excellent'
+    elif total_points >= 150:
+        return 'Good'
+    elif total_points >= 100:
+        return 'Average'
+    elif total_points >= 50:
+        return 'Below Average'
+    else:
+        return 'Poor'
+
+def new_monthly_stats():
+    """Empty per-staff monthly statistics"""
     stats = {}
-    for staff in STAFF_MEMBERS:
+    for staff in get_staff_members():
         stats[staff] = {
             'total_points': 0,
             'total_hours': 0,
@@ -214,75 +1522,546 @@ def get_monthly_stats(year, month):
             'average_hours': 0,
             'performance_grade': 'N/A'
         }
+    return stats
+
+def build_monthly_stats(records, working_days, award_perfect_attendance=True):
+    """Calculate monthly statistics for all staff from month rows"""
+    stats = new_monthly_stats()
+    working_day_set = set(working_days)
+    present_working_days = dict.fromkeys(stats, 0)
     
-    # Calculate basic stats
+    # Calculate basic stats (absent days do not count towards totals)
     for record in records:
         staff = record['staff_name']
-        if staff in stats:
+        if staff in stats and record['status'] != 'absent':
             stats[staff]['total_points'] += record['points'] or 0
             stats[staff]['total_hours'] += record['duty_hours'] or 0
             if record['status'] in ['present', 'field_work']:
                 stats[staff]['present_days'] += 1
+                if record['date'] in working_day_set:
+                    present_working_days[staff] += 1
     
-    # Check for perfect attendance and calculate bonuses
-    first_day = datetime(year, month, 1)
-    if month == 12:
-        last_day = datetime(year + 1, 1, 1) - timedelta(days=1)
-    else:
-        last_day = datetime(year, month + 1, 1) - timedelta(days=1)
-    
-    working_days = []
-    current_day = first_day
-    while current_day <= last_day:
-        if current_day.weekday() != 6:  # Not Sunday
-            working_days.append(current_day.strftime('%Y-%m-%d'))
-        current_day += timedelta(days=1)
+    return finish_monthly_stats(stats, working_days, award_perfect_attendance, present_working_days)
+
+def load_monthly_totals(year, month):
+    """Monthly statistics totals for all staff from staff_month_totals, one row per staff"""
+    conn = get_db_connection()
+    stats = new_monthly_stats()
+    for staff_id, total_points, hours_hundredths, present_days in query_rows(conn, MONTH_TOTALS_QUERY,
+                                                                            (year * 100 + month,)):
+        staff = get_staff_name(conn, staff_id)
+        if staff in stats:
+            stats[staff]['total_points'] = total_points
+            stats[staff]['total_hours'] = hours_hundredths / 100 if hours_hundredths else 0
+            stats[staff]['present_days'] = present_days
+    return stats
+
+def finish_monthly_stats(stats, working_days, award_perfect_attendance=True, present_working_days=None):
+    """Add perfect attendance bonuses, average hours and grades to summed monthly stats.
     
-    for staff in STAFF_MEMBERS:
-        if stats[staff]['present_days'] == len(working_days):
+    present_working_days counts only days present on working days; days worked on a
+    Sunday or holiday must not make up for a missed working day.
+    """
+    # Check for perfect attendance and calculate bonuses
+    for staff in get_staff_members():
+        present = stats[staff]['present_days'] if present_working_days is None else present_working_days[staff]
+        stats[staff]['perfect_attendance'] = bool(working_days) and present == len(working_days)
+        if award_perfect_attendance and stats[staff]['perfect_attendance']:
             stats[staff]['total_points'] += POINTS_CONFIG['perfect_attendance']
         
         if stats[staff]['present_days'] > 0:
             stats[staff]['average_hours'] = round(stats[staff]['total_hours'] / stats[staff]['present_days'], 2)
         
         # Calculate performance grade
-        total_points = stats[staff]['total_points']
-        if total_points >= 200:
-            stats[staff]['performance_grade'] = 'Excellent'
-        elif total_points >= 150:
-            stats[staff]['performance_grade'] = 'Good'
-        elif total_points >= 100:
-            stats[staff]['performance_grade'] = 'Average'
-        elif total_points >= 50:
-            stats[staff]['performance_grade'] = 'Below Average'
-        else:
-            stats[staff]['performance_grade'] = 'Poor'
+        stats[staff]['performance_grade'] = get_performance_grade(stats[staff]['total_points'])
     
     return stats
 
-def generate_daily_pdf(date_str):
-    """Generate daily attendance PDF"""
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, leftMargin=0.5*inch, rightMargin=0.5*inch)
-    styles = getSampleStyleSheet()
-    story = []
+# In-process LRU of monthly stats keyed by (branch, year, month), invalidated by attendance
+# writes. Entries remember the month's data version, so writes by other processes count too
+_monthly_stats_cache = OrderedDict()
+_monthly_stats_lock = threading.Lock()
+_monthly_stats_generation = 0
+
+def _copy_stats(stats):
+    return {staff: dict(values) for staff, values in stats.items()}
+
+def _get_cached_monthly_stats(year, month):
+    """Return (stats or None, token to pass to _store_monthly_stats)"""
+    key = (get_current_branch(), year, month)
+    # Read before any stats are computed, so a racing write can only make an entry look stale
+    version = get_month_version(year, month)
+    with _monthly_stats_lock:
+        token = (_monthly_stats_generation, version)
+        entry = _monthly_stats_cache.get(key)
+        if entry is None or entry[0] != version:
+            return None, token
+        _monthly_stats_cache.move_to_end(key)
+        return _copy_stats(entry[1]), token
+
+def _store_monthly_stats(year, month, stats, token):
+    generation, version = token
+    with _monthly_stats_lock:
+        # A write landed while these stats were being computed, they may already be stale
+        if generation != _monthly_stats_generation:
+            return
+        key = (get_current_branch(), year, month)
+        _monthly_stats_cache[key] = (version, _copy_stats(stats))
+        _monthly_stats_cache.move_to_end(key)
+        while len(_monthly_stats_cache) > MONTHLY_STATS_CACHE_SIZE:
+            _monthly_stats_cache.popitem(last=False)
+
+def invalidate_monthly_stats(months=None):
+    """Drop the current branch's cached stats for the given (year, month) pairs, or every cached month"""
+    global _monthly_stats_generation
+    branch = get_current_branch()
+    with _monthly_stats_lock:
+        _monthly_stats_generation += 1
+        if months is None:
+            _monthly_stats_cache.clear()
+            return
+        for year, month in months:
+            _monthly_stats_cache.pop((branch, year, month), None)
+
+def get_month_data(year, month):
+    """Get working days, per-day records and stats for a month.
     
-    # Title
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=18,
-        textColor=colors.darkblue,
-        alignment=1,
-        spaceAfter=20
-    )
+    Stats come from get_monthly_stats (the trigger-maintained totals), so the cached
+    entry is the same whichever of the two filled it.
+    """
+    working_days = get_working_days(year, month)
+    stats = get_monthly_stats(year, month)
+    records = load_month_attendance(year, month)
+    return working_days, build_daily_records(records, working_days), stats
+
+def get_monthly_stats(year, month):
+    """Get monthly statistics for all staff"""
+    stats, token = _get_cached_monthly_stats(year, month)
+    if stats is None:
+        stats = load_monthly_totals(year, month)
+        off_day_presence = count_off_day_presence(year, month)
+        present_working_days = {
+            staff: values['present_days'] - off_day_presence.get(staff, 0) for staff, values in stats.items()
+        }
+        stats = finish_monthly_stats(stats, get_working_days(year, month), present_working_days=present_working_days)
+        _store_monthly_stats(year, month, stats, token)
+    return stats
+
+def check_month_totals(conn):
+    """Rebuild staff_month_totals from scratch and return {(month, staff_id): (stored, rebuilt)} differences"""
+    stored = {
+        (row[0], row[1]): tuple(row[2:])
+        for row in query_rows(conn, 'SELECT month, staff_id, total_points, hours_hundredths, present_days '
+                                    'FROM staff_month_totals')
+    }
+    rebuilt = {(row[0], row[1]): tuple(row[2:]) for row in query_rows(conn, MONTH_TOTALS_REBUILD_QUERY)}
     
-    date_obj = datetime.strptime(date_str, '%Y-%m-%d')
-    formatted_date = date_obj.strftime('%B %d, %Y')
+    # Rows whose days were all deleted are left at zero rather than removed
+    empty = (0, 0, 0)
+    return {
+        key: (stored.get(key, empty), rebuilt.get(key, empty))
+        for key in stored.keys() | rebuilt.keys()
+        if stored.get(key, empty) != rebuilt.get(key, empty)
+    }
+
+def rebuild_month_totals(conn):
+    """Replace staff_month_totals with totals summed from attendance_days"""
+    with conn:
+        conn.execute('BEGIN IMMEDIATE')
+        conn.execute('DELETE FROM staff_month_totals')
+        conn.execute(f'INSERT INTO staff_month_totals {MONTH_TOTALS_REBUILD_QUERY}')
+        # Stats cached by running servers were built from the old totals
+        months = [row[0] for row in query_rows(conn, 'SELECT DISTINCT month FROM staff_month_totals')]
+        bump_data_versions(conn, {f'month:{month // 100}-{month % 100:02d}' for month in months})
+    invalidate_monthly_stats()
+
+def split_into_months(start_date, end_date):
+    """Split an inclusive date range into (year, month, first_date, last_date, partial) pieces"""
+    start = datetime.strptime(start_date, '%Y-%m-%d')
+    end = datetime.strptime(end_date, '%Y-%m-%d')
+    if end < start:
+        raise ValueError("End date must not be before start date")
     
-    title = Paragraph(f"Daily Attendance Report - {formatted_date}", title_style)
-    story.append(title)
-    story.append(Spacer(1, 20))
+    pieces = []
+    year, month = start.year, start.month
+    while (year, month) <= (end.year, end.month):
+        month_first, month_last = get_month_bounds(year, month)
+        first_date = max(month_first, start_date)
+        last_date = min(month_last, end_date)
+        pieces.append((year, month, first_date, last_date, (first_date, last_date) != (month_first, month_last)))
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return pieces
+
+def get_range_stats(start_date, end_date):
+    """Get statistics for all staff over a date range, composed from per-month aggregates.
+    
+    Whole months come from the monthly stats cache; only partial months at the
+    edges of the range are computed from rows (and earn no perfect attendance bonus).
+    """
+    staff_members = get_staff_members()
+    months = []
+    totals = {
+        staff: {'total_points': 0, 'total_hours': 0, 'present_days': 0, 'perfect_months': 0}
+        for staff in staff_members
+    }
+    working_day_count = 0
+    month_equivalents = 0
+    
+    for year, month, first_date, last_date, partial in split_into_months(start_date, end_date):
+        month_working_days = get_working_days(year, month)
+        if partial:
+            working_days = [day for day in month_working_days if first_date <= day <= last_date]
+            month_stats = build_monthly_stats(get_attendance_between(first_date, last_date), working_days,
+                                              award_perfect_attendance=False)
+        else:
+            working_days = month_working_days
+            month_stats = get_monthly_stats(year, month)
+        
+        working_day_count += len(working_days)
+        if month_working_days:
+            month_equivalents += len(working_days) / len(month_working_days)
+        
+        for staff in staff_members:
+            stats = month_stats[staff]
+            totals[staff]['total_points'] += stats['total_points']
+            totals[staff]['total_hours'] += stats['total_hours']
+            totals[staff]['present_days'] += stats['present_days']
+            if not partial and stats['perfect_attendance']:
+                totals[staff]['perfect_months'] += 1
+        
+        months.append({
+            'year': year,
+            'month': month,
+            'start_date': first_date,
+            'end_date': last_date,
+            'partial': partial,
+            'working_days': len(working_days),
+            'staff': {
+                staff: {key: month_stats[staff][key] for key in ('total_points', 'total_hours', 'present_days')}
+                for staff in staff_members
+            }
+        })
+    
+    for staff in staff_members:
+        stats = totals[staff]
+        stats['total_hours'] = round(stats['total_hours'], 2)
+        stats['average_hours'] = round(stats['total_hours'] / stats['present_days'], 2) if stats['present_days'] else 0
+        # Grades are defined per month, so grade the average points per (working-day weighted) month
+        monthly_points = stats['total_points'] / month_equivalents if month_equivalents else 0
+        stats['performance_grade'] = get_performance_grade(monthly_points)
+    
+    return {
+        'start_date': start_date,
+        'end_date': end_date,
+        'working_days': working_day_count,
+        'staff': totals,
+        'months': months
+    }
+
+def get_yearly_stats(year):
+    """Get statistics for all staff over a calendar year (twelve monthly aggregates)"""
+    return get_range_stats(f'{year}-01-01', f'{year}-12-31')
+
+# Leaderboards per (branch, start, end), each stored with the summed data version of its
+# months so any write to them (from any process) means a rebuild
+_leaderboard_cache = OrderedDict()
+_leaderboard_lock = threading.Lock()
+
+def get_leaderboard_months(start_date, end_date):
+    """LEADERBOARD_QUERY month rows for a period, led by the whole month before it"""
+    year, month = int(start_date[:4]), int(start_date[5:7])
+    previous = (year - 1, 12) if month == 1 else (year, month - 1)
+    previous_first, previous_last = get_month_bounds(*previous)
+    pieces = [(*previous, previous_first, previous_last, False, 0)]
+    pieces += [piece + (1,) for piece in split_into_months(start_date, end_date)]
+    return [
+        [year * 100 + month, encode_day(first_date), encode_day(last_date),
+         None if partial else len(get_working_days(year, month)), in_period]
+        for year, month, first_date, last_date, partial, in_period in pieces
+    ]
+
+def get_leaderboard(start_date, end_date):
+    """Rank the branch's staff by points over a date range, with streaks and monthly movement.
+    
+    Points match get_range_stats (perfect attendance bonuses for whole months only).
+    Streaks count consecutive working days present within the range; the current
+    streak is the one reaching the latest working day anyone was recorded present.
+    The first month's changes are measured against the month before the range.
+    """
+    months = get_leaderboard_months(start_date, end_date)
+    first_month = months[0][0]
+    key = (get_current_branch(), start_date, end_date)
+    version, _ = get_data_version(f'range:{first_month // 100}-{first_month % 100:02d}-01:{end_date}')
+    with _leaderboard_lock:
+        entry = _leaderboard_cache.get(key)
+        if entry is not None and entry[0] == version:
+            _leaderboard_cache.move_to_end(key)
+            return entry[1]
+    
+    conn = get_db_connection()
+    staff_ids = get_staff_ids(conn, get_staff_members())
+    roster = [staff_ids[staff] for staff in get_staff_members()]
+    rows = query_rows(conn, LEADERBOARD_QUERY, (
+        json.dumps(months), json.dumps(roster), encode_day(start_date), POINTS_CONFIG['perfect_attendance']
+    )).fetchall()
+    
+    standings = {}
+    for (staff_id, month, in_period, points, month_rank, delta, rank_change, rank, total_points,
+         present_days, perfect_months, current_streak, longest_streak) in rows:
+        standing = standings.get(staff_id)
+        if standing is None:
+            standing = standings[staff_id] = {
+                'rank': rank,
+                'staff_name': get_staff_name(conn, staff_id),
+                'total_points': total_points,
+                'present_days': present_days,
+                'perfect_months': perfect_months,
+                'current_streak': current_streak,
+                'longest_streak': longest_streak,
+                'months': []
+            }
+        if in_period:
+            standing['months'].append({
+                'month': f'{month // 100}-{month % 100:02d}',
+                'points': points,
+                'rank': month_rank,
+                'points_change': delta,
+                'rank_change': rank_change
+            })
+    
+    leaderboard = sorted(standings.values(), key=lambda standing: (standing['rank'], standing['staff_name']))
+    for standing in leaderboard:
+        # Movement of the latest month against the one before it
+        latest = standing['months'][-1]
+        standing['points_change'] = latest['points_change']
+        standing['rank_change'] = latest['rank_change']
+    result = {'start_date': start_date, 'end_date': end_date, 'leaderboard': leaderboard}
+    
+    with _leaderboard_lock:
+        _leaderboard_cache[key] = (version, result)
+        _leaderboard_cache.move_to_end(key)
+        while len(_leaderboard_cache) > LEADERBOARD_CACHE_SIZE:
+            _leaderboard_cache.popitem(last=False)
+    return result
+
+def get_leaderboard_period(params):
+    """Read a leaderboard period from start/end, year/month or year parameters (default: this month)"""
+    if params.get('start') or params.get('end'):
+        return get_date_range_params(params)
+    year = get_year_param(params.get('year'))
+    if params.get('month') or not params.get('year'):
+        month = int(params.get('month') or datetime.now().month)
+        if not 1 <= month <= 12:
+            raise ValueError(f"Invalid month: {month}")
+        return get_month_bounds(year, month)
+    return f'{year}-01-01', f'{year}-12-31'
+
+_branch_executor = None
+_branch_executor_lock = threading.Lock()
+
+def get_branch_executor():
+    """Get the shared thread pool used to query branch shards in parallel"""
+    global _branch_executor
+    with _branch_executor_lock:
+        if _branch_executor is None:
+            _branch_executor = ThreadPoolExecutor(max_workers=BRANCH_FANOUT_WORKERS, thread_name_prefix='branch')
+    return _branch_executor
+
+def get_branch_range_stats(branch, start_date, end_date):
+    with use_branch(branch):
+        return get_range_stats(start_date, end_date)
+
+def get_branch_summary(start_date, end_date):
+    """Range statistics of every branch, queried from each shard in parallel and merged.
+    
+    Each branch is summed from its own monthly totals, so the shards are never
+    attached to one connection and a busy branch only slows down its own part.
+    """
+    futures = {
+        branch: get_branch_executor().submit(get_branch_range_stats, branch, start_date, end_date)
+        for branch in BRANCHES
+    }
+    
+    branches = {}
+    totals = {'staff_count': 0, 'total_points': 0, 'total_hours': 0, 'present_days': 0}
+    for branch, future in futures.items():
+        stats = future.result()
+        summary = {
+            'name': BRANCHES[branch]['name'],
+            'staff_count': len(stats['staff']),
+            'total_points': sum(staff['total_points'] for staff in stats['staff'].values()),
+            'total_hours': round(sum(staff['total_hours'] for staff in stats['staff'].values()), 2),
+            'present_days': sum(staff['present_days'] for staff in stats['staff'].values()),
+            'staff': stats['staff']
+        }
+        summary['average_points'] = (
+            round(summary['total_points'] / summary['staff_count'], 2) if summary['staff_count'] else 0
+        )
+        branches[branch] = summary
+        for key in totals:
+            totals[key] += summary[key]
+    
+    totals['total_hours'] = round(totals['total_hours'], 2)
+    return {
+        'start_date': start_date,
+        'end_date': end_date,
+        'branches': branches,
+        'totals': totals
+    }
+
+# ReportLab and the report styles are loaded on the first PDF build (or by the warm-up
+# thread), not at import, so the check-in page starts without them
+_pdf_toolkit = None
+_pdf_toolkit_lock = threading.Lock()
+_pdf_warmup_lock = threading.Lock()
+_pdf_warmup_thread = None
+
+def _header_table_style(header_color, body_color, header_font_size, body_font_name, body_font_size,
+                        header_padding=None, striped=False):
+    from reportlab.lib import colors
+    from reportlab.platypus import TableStyle
+    commands = [
+        ('BACKGROUND', (0, 0), (-1, 0), header_color),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), header_font_size),
+    ]
+    if header_padding is not None:
+        commands.append(('BOTTOMPADDING', (0, 0), (-1, 0), header_padding))
+    commands += [
+        ('BACKGROUND', (0, 1), (-1, -1), body_color),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('FONTNAME', (0, 1), (-1, -1), body_font_name),
+        ('FONTSIZE', (0, 1), (-1, -1), body_font_size),
+    ]
+    if striped:
+        commands.append(('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey]))
+    return TableStyle(commands)
+
+@dataclass(frozen=True)
+class PdfToolkit:
+    """ReportLab classes and the report styles shared by every PDF build.
+    
+    Frozen, with read-only style and width registries, so one report cannot change
+    the styles of every report after it.
+    """
+    SimpleDocTemplate: type
+    Table: type
+    Paragraph: type
+    Spacer: type
+    A4: tuple
+    inch: float
+    paragraph_styles: MappingProxyType
+    table_styles: MappingProxyType
+    column_widths: MappingProxyType
+
+def load_pdf_toolkit():
+    """Import ReportLab and build the report styles shared by every PDF build"""
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+    from reportlab.platypus import SimpleDocTemplate, Table, Paragraph, Spacer
+    
+    stylesheet = getSampleStyleSheet()
+    return PdfToolkit(
+        SimpleDocTemplate=SimpleDocTemplate,
+        Table=Table,
+        Paragraph=Paragraph,
+        Spacer=Spacer,
+        A4=A4,
+        inch=inch,
+        paragraph_styles=MappingProxyType({
+            'daily_title': ParagraphStyle(
+                'DailyTitle',
+                parent=stylesheet['Heading1'],
+                fontSize=18,
+                textColor=colors.darkblue,
+                alignment=1,
+                spaceAfter=20
+            ),
+            'monthly_title': ParagraphStyle(
+                'MonthlyTitle',
+                parent=stylesheet['Heading1'],
+                fontSize=16,
+                textColor=colors.darkblue,
+                alignment=1,
+                spaceAfter=20
+            ),
+            'section': stylesheet['Heading3'],
+            'staff_heading': stylesheet['Heading4'],
+            'note': stylesheet['Normal'],
+        }),
+        table_styles=MappingProxyType({
+            'records': _header_table_style(colors.darkblue, colors.beige, 10, 'Helvetica', 9, header_padding=12, striped=True),
+            'detail_records': _header_table_style(colors.darkblue, colors.beige, 8, 'Helvetica', 7, header_padding=8, striped=True),
+            'daily_summary': _header_table_style(colors.darkgreen, colors.lightgreen, 11, 'Helvetica-Bold', 10),
+            'points_legend': _header_table_style(colors.darkgreen, colors.lightgreen, 10, 'Helvetica', 9),
+        }),
+        column_widths=MappingProxyType({
+            'daily_records': (2*inch, 1.2*inch, 0.8*inch, 0.8*inch, 0.8*inch, 0.6*inch, 1.5*inch),
+            'daily_summary': (2*inch, 1.5*inch),
+            'monthly_summary': (2*inch, 1*inch, 1*inch, 1*inch, 1*inch, 1*inch),
+            'detail_records': (0.8*inch, 0.8*inch, 0.8*inch, 0.8*inch, 0.6*inch, 0.6*inch, 1.2*inch),
+            'points_legend': (3*inch, 1*inch),
+            'range_summary': (1.8*inch, 0.9*inch, 0.9*inch, 0.9*inch, 0.9*inch, 0.9*inch, 0.9*inch),
+            'month_points': (2*inch, 0.85*inch, 0.85*inch, 0.85*inch, 0.85*inch, 0.85*inch, 0.85*inch),
+        })
+    )
+
+def get_pdf_toolkit():
+    """ReportLab classes and shared report styles (a PdfToolkit), loaded on first use"""
+    global _pdf_toolkit
+    if _pdf_toolkit is None:
+        with _pdf_toolkit_lock:
+            if _pdf_toolkit is None:
+                started = time.perf_counter()
+                _pdf_toolkit = load_pdf_toolkit()
+                app.logger.info('Loaded PDF toolkit in %.3fs', time.perf_counter() - started)
+    return _pdf_toolkit
+
+def warm_up_pdf_stack():
+    """Load ReportLab and render a throwaway page so its fonts are loaded too"""
+    pdf = get_pdf_toolkit()
+    doc = pdf.SimpleDocTemplate(io.BytesIO(), pagesize=pdf.A4)
+    doc.build([pdf.Paragraph('Warm-up', pdf.paragraph_styles['section']), make_report_table([['-']], 'points_legend', 'points_legend')])
+
+def start_pdf_warmup():
+    """Start the PDF warm-up thread unless it has run already or the toolkit is loaded"""
+    global _pdf_warmup_thread
+    with _pdf_warmup_lock:
+        if _pdf_warmup_thread is not None or _pdf_toolkit is not None:
+            return
+        _pdf_warmup_thread = threading.Thread(target=warm_up_pdf_stack, name='pdf-warmup', daemon=True)
+        _pdf_warmup_thread.start()
+
+def make_report_table(table_data, columns, style):
+    """Create a report Table using the shared column widths and table style"""
+    pdf = get_pdf_toolkit()
+    table = pdf.Table(table_data, colWidths=list(pdf.column_widths[columns][:len(table_data[0])]))
+    table.setStyle(pdf.table_styles[style])
+    return table
+
+def new_report_document(buffer):
+    """Create the A4 document template shared by all reports"""
+    pdf = get_pdf_toolkit()
+    return pdf.SimpleDocTemplate(buffer, pagesize=pdf.A4, leftMargin=0.5*pdf.inch, rightMargin=0.5*pdf.inch)
+
+def generate_daily_pdf(date_str, output=None):
+    """Generate daily attendance PDF into output (a new BytesIO by default)"""
+    pdf = get_pdf_toolkit()
+    buffer = output if output is not None else io.BytesIO()
+    doc = new_report_document(buffer)
+    story = []
+    
+    # Title
+    date_obj = datetime.strptime(date_str, '%Y-%m-%d')
+    formatted_date = date_obj.strftime('%B %d, %Y')
+    
+    title = pdf.Paragraph(f"Daily Attendance Report - {formatted_date}", pdf.paragraph_styles['daily_title'])
+    story.append(title)
+    story.append(pdf.Spacer(1, 20))
     
     # Get attendance data
     attendance_data = get_attendance_for_date(date_str)
@@ -294,7 +2073,7 @@ def generate_daily_pdf(date_str):
     total_hours = 0
     present_count = 0
     
-    for staff_name in STAFF_MEMBERS:
+    for staff_name in get_staff_members():
         data = attendance_data.get(staff_name, {})
         status = data.get('status', 'Not Recorded')
         entry_time = data.get('entry_time', '-')
@@ -331,84 +2110,84 @@ def generate_daily_pdf(date_str):
         ])
     
     # Create table
-    table = Table(table_data, colWidths=[2*inch, 1.2*inch, 0.8*inch, 0.8*inch, 0.8*inch, 0.6*inch, 1.5*inch])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 9),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey])
-    ]))
+    table = make_report_table(table_data, 'daily_records', 'records')
     
     story.append(table)
-    story.append(Spacer(1, 30))
+    story.append(pdf.Spacer(1, 30))
     
     # Summary
     summary_data = [
         ['Summary', 'Values'],
-        ['Staff Present', f"{present_count}/{len(STAFF_MEMBERS)}"],
+        ['Staff Present', f"{present_count}/{len(get_staff_members())}"],
         ['Total Duty Hours', f"{total_hours:.1f} hours"],
         ['Total Points Earned', f"{total_points:+d}"],
         ['Average Hours per Person', f"{total_hours/present_count:.1f}h" if present_count > 0 else "0h"]
     ]
     
-    summary_table = Table(summary_data, colWidths=[2*inch, 1.5*inch])
-    summary_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.darkgreen),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 11),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.lightgreen),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 1), (-1, -1), 10),
-    ]))
+    summary_table = make_report_table(summary_data, 'daily_summary', 'daily_summary')
     
     story.append(summary_table)
     
-    doc.build(story)
-    buffer.seek(0)
+    build_document(doc, story, 'daily')
+    if output is None:
+        buffer.seek(0)
     return buffer
 
-def generate_monthly_pdf(year, month):
-    """Generate monthly attendance PDF with detailed statistics"""
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=A4, leftMargin=0.5*inch, rightMargin=0.5*inch)
-    styles = getSampleStyleSheet()
-    story = []
+class LazyStory(list):
+    """Story list that pulls flowables from a generator as ReportLab consumes them.
     
-    # Title
-    title_style = ParagraphStyle(
-        'CustomTitle',
-        parent=styles['Heading1'],
-        fontSize=16,
-        textColor=colors.darkblue,
-        alignment=1,
-        spaceAfter=20
-    )
+    doc.build() only looks at the front of the story, so keeping a short
+    lookahead buffer means the full set of flowables never exists at once.
+    """
+    
+    def __init__(self, flowables, lookahead=16):
+        super().__init__()
+        self._source = iter(flowables)
+        self._lookahead = lookahead
     
+    def _fill(self):
+        while self._source is not None and list.__len__(self) < self._lookahead:
+            try:
+                self.append(next(self._source))
+            except StopIteration:
+                self._source = None
+    
+    def __len__(self):
+        self._fill()
+        return list.__len__(self)
+    
+    def __getitem__(self, index):
+        self._fill()
+        return list.__getitem__(self, index)
+
+def generate_monthly_pdf(year, month, output=None):
+    """Generate monthly attendance PDF with detailed statistics into output (a new BytesIO by default)"""
+    buffer = output if output is not None else io.BytesIO()
+    doc = new_report_document(buffer)
+    build_document(doc, LazyStory(iter_monthly_story(year, month)), 'monthly')
+    if output is None:
+        buffer.seek(0)
+    return buffer
+
+def iter_monthly_story(year, month):
+    """Yield the monthly report flowables one at a time, staff member by staff member"""
+    pdf = get_pdf_toolkit()
+    # Title
     month_name = calendar.month_name[month]
-    title = Paragraph(f"Monthly Attendance Report - {month_name} {year}", title_style)
-    story.append(title)
-    story.append(Spacer(1, 20))
+    yield pdf.Paragraph(f"Monthly Attendance Report - {month_name} {year}", pdf.paragraph_styles['monthly_title'])
+    yield pdf.Spacer(1, 20)
     
-    # Get monthly statistics
-    monthly_stats = get_monthly_stats(year, month)
+    # Get monthly statistics and daily records from a single month query
+    working_days, attendance_records, monthly_stats = get_month_data(year, month)
+    day_labels = [datetime.strptime(day, '%Y-%m-%d').strftime('%d-%m') for day in working_days]
     
     # Monthly Summary Table
-    story.append(Paragraph("<b>Monthly Performance Summary</b>", styles['Heading3']))
-    story.append(Spacer(1, 10))
+    yield pdf.Paragraph("<b>Monthly Performance Summary</b>", pdf.paragraph_styles['section'])
+    yield pdf.Spacer(1, 10)
     
     summary_data = [['Staff Member', 'Present Days', 'Total Hours', 'Avg Hours/Day', 'Total Points', 'Grade']]
     
-    for staff_name in STAFF_MEMBERS:
+    for staff_name in get_staff_members():
         stats = monthly_stats[staff_name]
         summary_data.append([
             staff_name,
@@ -419,74 +2198,24 @@ def generate_monthly_pdf(year, month):
             stats['performance_grade']
         ])
     
-    summary_table = Table(summary_data, colWidths=[2*inch, 1*inch, 1*inch, 1*inch, 1*inch, 1*inch])
-    summary_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 9),
-        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey])
-    ]))
+    summary_table = make_report_table(summary_data, 'monthly_summary', 'records')
     
-    story.append(summary_table)
-    story.append(Spacer(1, 30))
+    yield summary_table
+    yield pdf.Spacer(1, 30)
     
     # Detailed daily records for each staff member
-    story.append(Paragraph("<b>Detailed Daily Records</b>", styles['Heading3']))
-    story.append(Spacer(1, 15))
-    
-    # Get all working days in month
-    first_day = datetime(year, month, 1)
-    if month == 12:
-        last_day = datetime(year + 1, 1, 1) - timedelta(days=1)
-    else:
-        last_day = datetime(year, month + 1, 1) - timedelta(days=1)
-    
-    working_days = []
-    current_day = first_day
-    while current_day <= last_day:
-        if current_day.weekday() != 6:  # Not Sunday
-            working_days.append(current_day.strftime('%Y-%m-%d'))
-        current_day += timedelta(days=1)
-    
-    # Get attendance data for all working days
-    conn = get_db_connection()
-    attendance_records = {}
-    for day in working_days:
-        day_attendance = conn.execute(
-            'SELECT staff_name, status, entry_time, exit_time, duty_hours, points, remarks FROM attendance WHERE date = ?',
-            (day,)
-        ).fetchall()
-        attendance_records[day] = {
-            row['staff_name']: {
-                'status': row['status'],
-                'entry_time': row['entry_time'],
-                'exit_time': row['exit_time'],
-                'duty_hours': row['duty_hours'],
-                'points': row['points'],
-                'remarks': row['remarks']
-            } for row in day_attendance
-        }
-    conn.close()
+    yield pdf.Paragraph("<b>Detailed Daily Records</b>", pdf.paragraph_styles['section'])
+    yield pdf.Spacer(1, 15)
     
     # Create detailed table for each staff member
-    for staff_name in STAFF_MEMBERS:
-        story.append(Paragraph(f"<b>{staff_name}</b>", styles['Heading4']))
-        story.append(Spacer(1, 8))
+    for staff_name in get_staff_members():
+        yield pdf.Paragraph(f"<b>{staff_name}</b>", pdf.paragraph_styles['staff_heading'])
+        yield pdf.Spacer(1, 8)
         
         # Create table data for this staff member
         table_data = [['Date', 'Status', 'Entry', 'Exit', 'Hours', 'Points', 'Remarks']]
         
-        for day in working_days:
-            day_obj = datetime.strptime(day, '%Y-%m-%d')
-            formatted_date = day_obj.strftime('%d-%m')
-            
+        for day, formatted_date in zip(working_days, day_labels):
             data = attendance_records[day].get(staff_name, {})
             status = data.get('status', 'Not Recorded')
             entry_time = data.get('entry_time', '-')
@@ -519,27 +2248,14 @@ def generate_monthly_pdf(year, month):
             ])
         
         # Create table
-        table = Table(table_data, colWidths=[0.8*inch, 0.8*inch, 0.8*inch, 0.8*inch, 0.6*inch, 0.6*inch, 1.2*inch])
-        table.setStyle(TableStyle([
-            ('BACKGROUND', (0, 0), (-1, 0), colors.darkblue),
-            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-            ('FONTSIZE', (0, 0), (-1, 0), 8),
-            ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
-            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-            ('GRID', (0, 0), (-1, -1), 1, colors.black),
-            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-            ('FONTSIZE', (0, 1), (-1, -1), 7),
-            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.lightgrey])
-        ]))
+        table = make_report_table(table_data, 'detail_records', 'detail_records')
         
-        story.append(table)
-        story.append(Spacer(1, 15))
+        yield table
+        yield pdf.Spacer(1, 15)
     
     # Points system explanation
-    story.append(Paragraph("<b>Points System Explanation</b>", styles['Heading3']))
-    story.append(Spacer(1, 10))
+    yield pdf.Paragraph("<b>Points System Explanation</b>", pdf.paragraph_styles['section'])
+    yield pdf.Spacer(1, 10)
     
     points_explanation = [
         ['Activity', 'Points'],
@@ -553,579 +2269,714 @@ def generate_monthly_pdf(year, month):
         ['Perfect Monthly Attendance', f'+{POINTS_CONFIG["perfect_attendance"]}']
     ]
     
-    points_table = Table(points_explanation, colWidths=[3*inch, 1*inch])
-    points_table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.darkgreen),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.lightgreen),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-        ('FONTSIZE', (0, 1), (-1, -1), 9),
-    ]))
-    
-    story.append(points_table)
+    points_table = make_report_table(points_explanation, 'points_legend', 'points_legend')
     
-    doc.build(story)
-    buffer.seek(0)
+    yield points_table
+
+def generate_range_pdf(start_date, end_date, output=None, title=None):
+    """Generate a date-range (or annual) attendance PDF from per-month aggregates"""
+    buffer = output if output is not None else io.BytesIO()
+    doc = new_report_document(buffer)
+    build_document(doc, LazyStory(iter_range_story(start_date, end_date, title)), 'range')
+    if output is None:
+        buffer.seek(0)
     return buffer
 
-# Enhanced HTML Template
-HTML_TEMPLATE = '''
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Staff Attendance Management</title>
-    <style>
-        * {
-            margin: 0;
-            padding: 0;
-            box-sizing: border-box;
-        }
-        
-        body {
-            font-family: 'Segoe UI', Tahoma, Geneva, Verdana, sans-serif;
-            background: linear-gradient(135deg, #667eea 0%, #764ba2 100%);
-            min-height: 100vh;
-            padding: 20px;
-        }
-        
-        .container {
-            max-width: 1000px;
-            margin: 0 auto;
-            background: white;
-            border-radius: 20px;
-            box-shadow: 0 20px 40px rgba(0,0,0,0.1);
-            overflow: hidden;
-        }
-        
-        .header {
-            background: linear-gradient(135deg, #2c3e50 0%, #3498db 100%);
-            color: white;
-            padding: 30px;
-            text-align: center;
-        }
-        
-        .header h1 {
-            font-size: 2.5rem;
-            margin-bottom: 10px;
-            font-weight: 300;
-        }
-        
-        .current-date {
-            font-size: 1.2rem;
-            opacity: 0.9;
-        }
-        
-        .content {
-            padding: 40px;
-        }
-        
-        .date-selector {
-            background: #f8f9fa;
-            padding: 20px;
-            border-radius: 10px;
-            margin-bottom: 30px;
-        }
-        
-        .date-selector label {
-            font-weight: 600;
-            color: #2c3e50;
-            margin-right: 15px;
-        }
-        
-        .date-selector input {
-            padding: 10px;
-            border: 2px solid #e0e0e0;
-            border-radius: 5px;
-            font-size: 16px;
-            margin-right: 15px;
-        }
-        
-        .btn {
-            background: linear-gradient(135deg, #3498db 0%, #2980b9 100%);
-            color: white;
-            border: none;
-            padding: 12px 24px;
-            border-radius: 25px;
-            cursor: pointer;
-            font-size: 16px;
-            font-weight: 600;
-            transition: all 0.3s ease;
-            margin: 5px;
-        }
-        
-        .btn:hover {
-            transform: translateY(-2px);
-            box-shadow: 0 10px 20px rgba(52, 152, 219, 0.3);
-        }
-        
-        .btn-success {
-            background: linear-gradient(135deg, #27ae60 0%, #2ecc71 100%);
-        }
-        
-        .btn-success:hover {
-            box-shadow: 0 10px 20px rgba(46, 204, 113, 0.3);
-        }
-        
-        .attendance-grid {
-            display: grid;
-            gap: 20px;
-            margin-bottom: 30px;
-        }
-        
-        .staff-card {
-            background: #f8f9fa;
-            border: 2px solid #e0e0e0;
-            border-radius: 15px;
-            padding: 25px;
-            transition: all 0.3s ease;
-        }
-        
-        .staff-card:hover {
-            transform: translateY(-5px);
-            box-shadow: 0 15px 30px rgba(0,0,0,0.1);
-        }
-        
-        .staff-name {
-            font-size: 1.3rem;
-            font-weight: 600;
-            color: #2c3e50;
-            margin-bottom: 15px;
-        }
-        
-        .attendance-row {
-            display: grid;
-            grid-template-columns: 1fr 1fr;
-            gap: 15px;
-            margin-bottom: 15px;
-        }
-        
-        .attendance-options {
-            display: flex;
-            gap: 10px;
-        }
-        
-        .radio-option {
-            display: flex;
-            align-items: center;
-            padding: 8px 16px;
-            background: white;
-            border: 2px solid #e0e0e0;
-            border-radius: 20px;
-            cursor: pointer;
-            transition: all 0.3s ease;
-            font-size: 14px;
-        }
-        
-        .radio-option:hover {
-            border-color: #3498db;
-        }
-        
-        .radio-option.selected {
-            background: #3498db;
-            color: white;
-            border-color: #3498db;
-        }
-        
-        .radio-option input {
-            display: none;
-        }
-        
-        .time-input {
-            display: flex;
-            align-items: center;
-            gap: 10px;
-        }
-        
-        .time-input label {
-            font-weight: 600;
-            color: #2c3e50;
-            min-width: 80px;
-        }
-        
-        .time-input input {
-            padding: 8px;
-            border: 2px solid #e0e0e0;
-            border-radius: 5px;
-            font-size: 14px;
-            width: 100px;
-        }
-        
-        .remarks-section {
-            grid-column: 1 / -1;
-            margin-top: 10px;
-        }
-        
-        .remarks-section label {
-            font-weight: 600;
-            color: #2c3e50;
-            display: block;
-            margin-bottom: 5px;
-        }
-        
-        .remarks-section textarea {
-            width: 100%;
-            padding: 10px;
-            border: 2px solid #e0e0e0;
-            border-radius: 5px;
-            font-size: 14px;
-            resize: vertical;
-            min-height: 80px;
-        }
-        
-        .duty-hours-display {
-            background: #e8f5e8;
-            padding: 10px;
-            border-radius: 5px;
-            text-align: center;
-            font-weight: 600;
-            color: #2c5530;
-        }
-        
-        .points-display {
-            background: #e8f0ff;
-            padding: 10px;
-            border-radius: 5px;
-            text-align: center;
-            font-weight: 600;
-            color: #1e40af;
-        }
-        
-        .reports-section {
-            background: #f8f9fa;
-            padding: 30px;
-            border-radius: 15px;
-            margin-top: 30px;
-        }
-        
-        .reports-section h3 {
-            color: #2c3e50;
-            margin-bottom: 20px;
-            font-size: 1.5rem;
-        }
-        
-        .report-buttons {
-            display: flex;
-            flex-wrap: wrap;
-            gap: 15px;
-        }
-        
-        .sunday-notice {
-            background: #fff3cd;
-            border: 1px solid #ffeaa7;
-            padding: 20px;
-            border-radius: 10px;
-            text-align: center;
-            color: #856404;
-            font-size: 1.1rem;
-        }
-        
-        .success-message {
-            background: #d4edda;
-            border: 1px solid #c3e6cb;
-            padding: 15px;
-            border-radius: 10px;
-            color: #155724;
-            margin-bottom: 20px;
-        }
-        
-        .points-info {
-            background: #e3f2fd;
-            border: 1px solid #bbdefb;
-            padding: 20px;
-            border-radius: 10px;
-            margin-bottom: 30px;
-        }
-        
-        .points-info h4 {
-            color: #1565c0;
-            margin-bottom: 15px;
-        }
+def iter_range_story(start_date, end_date, title=None):
+    """Yield the date-range report flowables"""
+    pdf = get_pdf_toolkit()
+    range_stats = get_range_stats(start_date, end_date)
+    
+    # Title
+    if title is None:
+        first = datetime.strptime(start_date, '%Y-%m-%d').strftime('%B %d, %Y')
+        last = datetime.strptime(end_date, '%Y-%m-%d').strftime('%B %d, %Y')
+        title = f"Attendance Report - {first} to {last}"
+    yield pdf.Paragraph(title, pdf.paragraph_styles['monthly_title'])
+    yield pdf.Spacer(1, 20)
+    
+    # Performance summary over the whole range
+    yield pdf.Paragraph("<b>Performance Summary</b>", pdf.paragraph_styles['section'])
+    yield pdf.Spacer(1, 10)
+    
+    summary_data = [['Staff Member', 'Present Days', 'Total Hours', 'Avg Hours/Day', 'Total Points', 'Perfect Months', 'Grade']]
+    for staff_name in get_staff_members():
+        stats = range_stats['staff'][staff_name]
+        summary_data.append([
+            staff_name,
+            f"{stats['present_days']}/{range_stats['working_days']}",
+            f"{stats['total_hours']:.1f}h",
+            f"{stats['average_hours']:.1f}h",
+            f"{stats['total_points']:+d}",
+            str(stats['perfect_months']),
+            stats['performance_grade']
+        ])
+    yield make_report_table(summary_data, 'range_summary', 'records')
+    yield pdf.Spacer(1, 30)
+    
+    # Points month by month, six months per table to fit the page width
+    yield pdf.Paragraph("<b>Monthly Points</b>", pdf.paragraph_styles['section'])
+    yield pdf.Spacer(1, 10)
+    
+    months = range_stats['months']
+    for offset in range(0, len(months), 6):
+        chunk = months[offset:offset + 6]
+        table_data = [['Staff Member'] + [
+            f"{calendar.month_abbr[item['month']]} {item['year']}{'*' if item['partial'] else ''}" for item in chunk
+        ]]
+        for staff_name in get_staff_members():
+            table_data.append([staff_name] + [f"{item['staff'][staff_name]['total_points']:+d}" for item in chunk])
+        yield make_report_table(table_data, 'month_points', 'records')
+        yield pdf.Spacer(1, 15)
+    
+    if any(item['partial'] for item in months):
+        yield pdf.Paragraph("* Partial month, no perfect attendance bonus", pdf.paragraph_styles['note'])
+
+def get_config_fingerprint():
+    """Hash of the settings that change report contents without touching attendance rows"""
+    settings = json.dumps([get_staff_members(), POINTS_CONFIG, THRESHOLDS_CONFIG], sort_keys=True)
+    return hashlib.sha256(settings.encode('utf-8')).hexdigest()
+
+def get_data_version(period):
+    """Get (version, last_modified) of a 'day:YYYY-MM-DD', 'month:YYYY-MM',
+    'range:YYYY-MM-DD:YYYY-MM-DD' or 'year:YYYY' period"""
+    conn = get_db_connection()
+    kind, _, value = period.partition(':')
+    if kind in ('range', 'year'):
+        start_date, end_date = value.split(':') if kind == 'range' else (f'{value}-01-01', f'{value}-12-31')
+        # Versions only ever grow, so their sum changes whenever any month in the range does
+        row = conn.execute(
+            'SELECT SUM(version) AS version, MAX(updated_at) AS updated_at FROM data_versions WHERE period BETWEEN ? AND ?',
+            (f'month:{start_date[:7]}', f'month:{end_date[:7]}')
+        ).fetchone()
+    else:
+        row = conn.execute('SELECT version, updated_at FROM data_versions WHERE period = ?', (period,)).fetchone()
+    if row is None or row['version'] is None:
+        return 0, None
+    return row['version'], datetime.strptime(row['updated_at'], '%Y-%m-%d %H:%M:%S').replace(tzinfo=timezone.utc)
+
+def get_touched_periods(dates):
+    """Data version periods affected by writes to the given dates"""
+    periods = set()
+    for date_str in dates:
+        periods.add(f'day:{date_str}')
+        periods.add(f'month:{date_str[:7]}')
+    return periods
+
+def bump_data_versions(conn, periods):
+    """Bump the data version of each period, inside the caller's transaction"""
+    conn.executemany(BUMP_DATA_VERSION_QUERY, [(period,) for period in periods])
+
+def build_pdf_timed(build_pdf, output, description):
+    """Render a report into output and log its build time (the time to first byte)"""
+    started = time.perf_counter()
+    build_pdf(output)
+    build_seconds = time.perf_counter() - started
+    app.logger.info('Built %s in %.3fs', description, build_seconds)
+    return build_seconds
+
+def get_cached_pdf(kind, period, build_pdf):
+    """Return (path, etag, last_modified, build_seconds) of a rendered report, building it on a cache miss.
+    
+    Files are content-addressed by branch, report kind, period, data version and
+    config fingerprint, so a new attendance save simply produces a new key.
+    build_seconds is None when the report came from the cache.
+    """
+    version, last_modified = get_data_version(period)
+    cache_key = hashlib.sha256(
+        f'{get_current_branch()}|{kind}|{period}|{version}|{get_config_fingerprint()}'.encode('utf-8')
+    ).hexdigest()
+    path = os.path.abspath(os.path.join(PDF_CACHE_DIR, f'{cache_key}.pdf'))
+    
+    try:
+        # Mark as recently used for eviction
+        os.utime(path)
+        return path, cache_key, last_modified, None
+    except FileNotFoundError:
+        pass  # Not built yet, or just evicted by another thread or worker process
+    
+    os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+    # Render straight into a temporary file so readers never see a partial PDF
+    fd, temp_path = tempfile.mkstemp(dir=PDF_CACHE_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            build_seconds = build_pdf_timed(build_pdf, temp_file, f'{kind} report for {period}')
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    
+    evict_pdf_cache()
+    return path, cache_key, last_modified, build_seconds
+
+def evict_pdf_cache(max_bytes=None):
+    """Delete least recently used PDFs until the cache fits in max_bytes"""
+    if max_bytes is None:
+        max_bytes = PDF_CACHE_MAX_BYTES
+    
+    entries = []
+    total_size = 0
+    for entry in os.scandir(PDF_CACHE_DIR):
+        if entry.name.endswith('.pdf'):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total_size += stat.st_size
+    
+    for _, size, path in sorted(entries):
+        if total_size <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_size -= size
+
+def send_cached_pdf(kind, period, build_pdf, filename):
+    """Send a cached report with ETag/Last-Modified, answering 304 when unchanged"""
+    if PDF_CACHE_MAX_BYTES <= 0:
+        return stream_pdf_response(kind, period, build_pdf, filename)
+    
+    path, etag, last_modified, build_seconds = get_cached_pdf(kind, period, build_pdf)
+    try:
+        response = send_pdf_file(path, filename, etag, last_modified)
+    except FileNotFoundError:
+        # Evicted by another thread or worker since the lookup, so render it again;
+        # the new file is the most recently used and the last to be evicted
+        path, etag, last_modified, build_seconds = get_cached_pdf(kind, period, build_pdf)
+        response = send_pdf_file(path, filename, etag, last_modified)
+    if build_seconds is not None:
+        response.headers['Server-Timing'] = f'pdf;dur={build_seconds * 1000:.1f}'
+    return response
+
+def send_pdf_file(path, filename, etag, last_modified):
+    """Send a cached PDF as a conditional download; raises FileNotFoundError if it is gone"""
+    return send_file(
+        path,
+        as_attachment=True,
+        download_name=filename,
+        mimetype='application/pdf',
+        etag=etag,
+        last_modified=last_modified,
+        conditional=True
+    )
+
+def stream_pdf_response(kind, period, build_pdf, filename):
+    """Render a report into a spooled temp file and stream it back in chunks"""
+    spool = tempfile.SpooledTemporaryFile(max_size=PDF_SPOOL_MAX_BYTES)
+    try:
+        build_seconds = build_pdf_timed(build_pdf, spool, f'{kind} report for {period}')
+    except BaseException:
+        spool.close()
+        raise
+    size = spool.tell()
+    spool.seek(0)
+    
+    def generate():
+        with spool:
+            while True:
+                chunk = spool.read(PDF_STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+    
+    response = Response(generate(), mimetype='application/pdf')
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    response.headers['Content-Length'] = str(size)
+    response.headers['Server-Timing'] = f'pdf;dur={build_seconds * 1000:.1f}'
+    return response
+
+def get_report_spec(kind, params):
+    """Resolve report parameters into (period, build_pdf, filename); raises ValueError if invalid"""
+    if kind == 'daily':
+        date_str = normalize_date(params.get('date') or datetime.now().strftime('%Y-%m-%d'))
+        day_off_reason = get_day_off_reason(date_str)
+        if day_off_reason == 'Sunday':
+            raise ValueError("No attendance report available for Sundays")
+        if day_off_reason is not None:
+            raise ValueError(f"No attendance report available for holidays ({day_off_reason})")
+        return (
+            f'day:{date_str}',
+            lambda output: generate_daily_pdf(date_str, output),
+            f"attendance_daily_{date_str}.pdf"
+        )
+    
+    if kind == 'monthly':
+        year = get_year_param(params.get('year'))
+        month = int(params.get('month') or datetime.now().month)
+        if not 1 <= month <= 12:
+            raise ValueError(f"Invalid month: {month}")
+        return (
+            f'month:{year}-{month:02d}',
+            lambda output: generate_monthly_pdf(year, month, output),
+            f"attendance_monthly_{year}_{month:02d}.pdf"
+        )
+    
+    if kind == 'yearly':
+        year = get_year_param(params.get('year'))
+        return (
+            f'year:{year}',
+            lambda output: generate_range_pdf(f'{year}-01-01', f'{year}-12-31', output,
+                                              title=f"Annual Attendance Report - {year}"),
+            f"attendance_yearly_{year}.pdf"
+        )
+    
+    if kind == 'range':
+        start_date, end_date = get_date_range_params(params)
+        return (
+            f'range:{start_date}:{end_date}',
+            lambda output: generate_range_pdf(start_date, end_date, output),
+            f"attendance_{start_date}_to_{end_date}.pdf"
+        )
+    
+    raise ValueError(f"Unknown report type: {kind}")
+
+def get_date_range_params(params):
+    """Read and validate 'start' and 'end' dates (YYYY-MM-DD) from request parameters"""
+    start_date = params.get('start')
+    end_date = params.get('end')
+    if not start_date or not end_date:
+        raise ValueError("Both start and end dates (YYYY-MM-DD) are required")
+    # Normalises the format and rejects invalid or reversed ranges
+    start_date = normalize_date(start_date)
+    end_date = normalize_date(end_date)
+    get_year_param(start_date[:4])
+    get_year_param(end_date[:4])
+    split_into_months(start_date, end_date)
+    return start_date, end_date
+
+def get_year_param(value):
+    """Read a year parameter (default: this year); raises ValueError outside MIN_YEAR..MAX_YEAR"""
+    try:
+        year = int(value or datetime.now().year)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid year: {value}") from None
+    if not MIN_YEAR <= year <= MAX_YEAR:
+        raise ValueError(f"Year must be between {MIN_YEAR} and {MAX_YEAR}")
+    return year
+
+# Background report jobs: renders run on a bounded thread pool and land in the PDF cache.
+# Each job's status is also written to a small JSON record under the cache directory, so
+# any worker process can answer status polls and downloads for it
+_report_executor = None
+_report_jobs = OrderedDict()
+_report_job_keys = {}
+_report_jobs_lock = threading.Lock()
+_report_executor_lock = threading.Lock()
+REPORT_JOB_CANCELLED_ERROR = 'Server restarted before the report was rendered'
+REPORT_JOB_ID_PATTERN = re.compile(r'[0-9a-f]{32}$')
+
+def get_report_executor():
+    """Get the shared report thread pool, created on first use"""
+    global _report_executor
+    with _report_executor_lock:
+        if _report_executor is None:
+            _report_executor = ThreadPoolExecutor(max_workers=REPORT_JOB_WORKERS, thread_name_prefix='report-job')
+    return _report_executor
+
+def get_report_job_error(future):
+    """Error message of a finished job that failed or was cancelled, None if it succeeded"""
+    if future.cancelled():
+        return REPORT_JOB_CANCELLED_ERROR
+    error = future.exception()
+    return None if error is None else str(error)
+
+def get_report_job_path(job_id):
+    """Path of a job's status record"""
+    return os.path.join(PDF_CACHE_DIR, 'jobs', f'{job_id}.json')
+
+def write_report_job_record(job_id, job, status, error=None):
+    """Save a job's status where every worker process can read it"""
+    record = {
+        'job_id': job_id,
+        'branch': job['branch'],
+        'type': job['kind'],
+        'period': job['period'],
+        'params': job['params'],
+        'filename': job['filename'],
+        'status': status,
+        'error': error,
+        'submitted_at': job['submitted_at'].isoformat(),
+    }
+    path = get_report_job_path(job_id)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    with os.fdopen(fd, 'w') as temp_file:
+        json.dump(record, temp_file)
+    os.replace(temp_path, path)
+
+def prune_report_job_records():
+    """Delete job status records (and stray temp files) older than REPORT_JOB_RECORD_MAX_AGE.
+    
+    Records of jobs run by other or restarted worker processes are never removed by
+    submit_report_job's history limit, so they expire by modification time instead.
+    """
+    cutoff = time.time() - REPORT_JOB_RECORD_MAX_AGE
+    try:
+        entries = list(os.scandir(os.path.join(PDF_CACHE_DIR, 'jobs')))
+    except FileNotFoundError:
+        return
+    for entry in entries:
+        with contextlib.suppress(FileNotFoundError):
+            if entry.stat().st_mtime < cutoff:
+                os.remove(entry.path)
+
+def run_report_job(job_id, job, build_pdf):
+    """Render a job's report into the PDF cache, keeping its status record up to date.
+    
+    Runs in a fresh context: no request, and the job's own branch.
+    """
+    with app.app_context(), use_branch(job['branch']):
+        write_report_job_record(job_id, job, 'running')
+        try:
+            result = get_cached_pdf(job['kind'], job['period'], build_pdf)
+        except Exception as error:
+            write_report_job_record(job_id, job, 'failed', str(error))
+            raise
+        write_report_job_record(job_id, job, 'done')
+        return result
+
+def submit_report_job(kind, params):
+    """Queue a report render and return its job id, reusing a pending or finished job for the same data"""
+    period, build_pdf, filename = get_report_spec(kind, params)
+    version, _ = get_data_version(period)
+    branch = get_current_branch()
+    key = (branch, kind, period, version, get_config_fingerprint())
+    
+    with _report_jobs_lock:
+        job_id = _report_job_keys.get(key)
+        job = _report_jobs.get(job_id)
+        if job is not None:
+            future = job['future']
+            # A failed render gets a fresh job, anything else is shared
+            if not (future.done() and get_report_job_error(future) is not None):
+                return job_id
         
-        .points-breakdown {
-            display: grid;
-            grid-template-columns: repeat(auto-fit, minmax(250px, 1fr));
-            gap: 10px;
-            font-size: 14px;
-            color: #1565c0;
+        job_id = uuid.uuid4().hex
+        job = {
+            'branch': branch,
+            'kind': kind,
+            'period': period,
+            'params': dict(params),
+            'filename': filename,
+            'submitted_at': datetime.now(timezone.utc),
         }
+        write_report_job_record(job_id, job, 'queued')
+        # Run in an empty context: copying this one would carry the request (and its g) into the job
+        job['future'] = get_report_executor().submit(contextvars.Context().run, run_report_job,
+                                                     job_id, job, build_pdf)
+        _report_jobs[job_id] = job
+        _report_job_keys[key] = job_id
         
-        @media (max-width: 768px) {
-            .header h1 {
-                font-size: 2rem;
-            }
-            
-            .content {
-                padding: 20px;
-            }
-            
-            .attendance-row {
-                grid-template-columns: 1fr;
-            }
-            
-            .attendance-options {
-                flex-direction: column;
-            }
-            
-            .report-buttons {
-                flex-direction: column;
-            }
-            
-            .time-input {
-                flex-direction: column;
-                align-items: flex-start;
-            }
-        }
-    </style>
-</head>
-<body>
-    <div class="container">
-        <div class="header">
-            <h1>Staff Attendance Management</h1>
-            <div class="current-date">{{ current_date_formatted }}</div>
-        </div>
+        # Forget the oldest finished jobs beyond the history limit
+        for old_id in list(_report_jobs):
+            if len(_report_jobs) <= REPORT_JOB_HISTORY:
+                break
+            if _report_jobs[old_id]['future'].done():
+                del _report_jobs[old_id]
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(get_report_job_path(old_id))
+        for old_key in [k for k, v in _report_job_keys.items() if v not in _report_jobs]:
+            del _report_job_keys[old_key]
+    
+    prune_report_job_records()
+    return job_id
+
+def get_report_job(job_id):
+    """Get a job's status dict, or None for an unknown id"""
+    if not REPORT_JOB_ID_PATTERN.match(job_id):
+        return None
+    with _report_jobs_lock:
+        job = _report_jobs.get(job_id)
+    if job is None:
+        # Submitted to another worker process (or before a restart)
+        try:
+            with open(get_report_job_path(job_id)) as record_file:
+                return json.load(record_file)
+        except FileNotFoundError:
+            return None
+    
+    future = job['future']
+    error = get_report_job_error(future) if future.done() else None
+    if future.running():
+        status = 'running'
+    elif not future.done():
+        status = 'queued'
+    elif error is not None:
+        status = 'failed'
+    else:
+        status = 'done'
+    
+    return {
+        'job_id': job_id,
+        'branch': job['branch'],
+        'type': job['kind'],
+        'period': job['period'],
+        'params': job['params'],
+        'filename': job['filename'],
+        'status': status,
+        'error': error,
+        'submitted_at': job['submitted_at'].isoformat(),
+    }
+
+# Held by the one request being profiled: Python 3.12+ allows a single active profiler
+# per process, so requests that arrive meanwhile run unprofiled
+_request_profiler_lock = threading.Lock()
+
+@app.before_request
+def start_request_metrics():
+    g.request_started = time.perf_counter()
+    g.sql_statements = 0
+    g.sql_seconds = 0.0
+    if METRICS_CONFIG['profile_slow_requests'] and _request_profiler_lock.acquire(blocking=False):
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:  # Another profiler (e.g. a debugger's) is already active
+            _request_profiler_lock.release()
+        else:
+            g.profiler = profiler
+
+@app.before_request
+def select_branch():
+    data = request.get_json(silent=True) if request.is_json else None
+    branch = request.values.get('branch') or (data.get('branch') if isinstance(data, dict) else None)
+    branch = branch or DEFAULT_BRANCH
+    if branch not in BRANCHES:
+        return f"Unknown branch: {branch}", 404
+    g.branch_token = _current_branch.set(branch)
+
+@app.teardown_request
+def reset_branch(error=None):
+    token = g.pop('branch_token', None)
+    if token is not None:
+        _current_branch.reset(token)
+
+@app.after_request
+def record_request_metrics(response):
+    started = g.get('request_started')
+    if started is None:
+        return response
+    elapsed = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    
+    REQUEST_LATENCY.observe(elapsed, route, request.method, str(response.status_code))
+    REQUEST_SQL_STATEMENTS.observe(g.sql_statements, route)
+    server_timing = f'db;dur={g.sql_seconds * 1000:.1f};desc="{g.sql_statements} queries"'
+    if 'Server-Timing' in response.headers:
+        server_timing = f"{response.headers['Server-Timing']}, {server_timing}"
+    response.headers['Server-Timing'] = server_timing
+    
+    profiler = g.get('profiler')
+    if profiler is not None:
+        profiler.disable()
+        if elapsed >= METRICS_CONFIG['slow_request_seconds']:
+            dump_request_profile(profiler, elapsed)
+    return response
+
+@app.teardown_request
+def release_request_profiler(error=None):
+    # Also runs when the request failed and after_request was skipped
+    profiler = g.pop('profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        _request_profiler_lock.release()
+
+def dump_request_profile(profiler, elapsed):
+    """Write a slow request's cProfile stats to the profile directory"""
+    os.makedirs(METRICS_CONFIG['profile_dir'], exist_ok=True)
+    endpoint = request.endpoint or 'unmatched'
+    filename = f"{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}_{endpoint}_{elapsed * 1000:.0f}ms.prof"
+    path = os.path.join(METRICS_CONFIG['profile_dir'], filename)
+    profiler.dump_stats(path)
+    app.logger.warning('Slow request %s %s took %.3fs, profile written to %s', request.method, request.path, elapsed, path)
+
+def iter_attendance_export(start_date, end_date, staff_names=None):
+    """Return an iterator of attendance rows for a date range (and optionally some staff) read off a cursor.
+    
+    The query runs now, against the current branch, so the rows can be streamed
+    after the request context (and its branch) is gone.
+    """
+    conn = get_db_connection()
+    staff_ids = None
+    if staff_names:
+        if not conn.staff_ids.keys() >= set(staff_names):
+            load_staff(conn)
+        staff_ids = json.dumps([conn.staff_ids[name] for name in staff_names if name in conn.staff_ids])
+    
+    return iter_export_rows(conn, query_rows(conn, EXPORT_QUERY, (encode_day(start_date), encode_day(end_date), staff_ids)))
+
+def iter_export_rows(conn, cursor):
+    """Decode export query rows in EXPORT_COLUMNS order, fetching EXPORT_BATCH_SIZE at a time"""
+    try:
+        while True:
+            rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+            if not rows:
+                break
+            for staff_id, day, status, entry_minute, exit_minute, duty_hours, points, remarks, updated_at in rows:
+                # Same order as EXPORT_COLUMNS
+                yield (
+                    decode_day(day), get_staff_name(conn, staff_id), STATUS_NAMES.get(status),
+                    decode_minutes(entry_minute), decode_minutes(exit_minute), duty_hours, points, remarks,
+                    decode_timestamp(updated_at)
+                )
+    finally:
+        cursor.close()
+
+def iter_csv_export(rows):
+    """Encode rows as CSV, yielding one chunk per batch of rows"""
+    import csv
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    for index, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if index % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+class StreamBuffer:
+    """Write-only file object that collects bytes until a streaming generator drains them"""
+    
+    def __init__(self):
+        self._chunks = []
+    
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def flush(self):
+        pass
+    
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+XLSX_INVALID_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+
+XLSX_STATIC_PARTS = {
+    '[Content_Types].xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+        'Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/workbook.xml': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+        'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+        '<sheets><sheet name="Attendance" sheetId="1" r:id="rId1"/></sheets>'
+        '</workbook>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+        '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+        '<Relationship Id="rId1" '
+        'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+        'Target="worksheets/sheet1.xml"/>'
+        '</Relationships>'
+    ),
+}
+
+def _xlsx_cell(value):
+    if value is None:
+        return '<c/>'
+    if isinstance(value, (int, float)):
+        return f'<c><v>{value}</v></c>'
+    text = html.escape(XLSX_INVALID_CHARS.sub('', str(value)), quote=False)
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+def iter_xlsx_export(rows):
+    """Encode rows as a single-sheet XLSX workbook, streamed as it is zipped"""
+    import zipfile  # Only XLSX exports need it, so it isn't loaded at startup
+
+    output = StreamBuffer()
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_DEFLATED) as workbook:
+        for name, content in XLSX_STATIC_PARTS.items():
+            workbook.writestr(name, content)
+        yield output.drain()
         
-        <div class="content">
-            {% if success_message %}
-            <div class="success-message">
-                {{ success_message }}
-            </div>
-            {% endif %}
-            
-            <div class="points-info">
-                <h4>🎯 Points System</h4>
-                <div class="points-breakdown">
-                    <div>✅ Full Day (7.5+ hrs): +10 points</div>
-                    <div>⏰ Half Day (4-7.4 hrs): +5 points</div>
-                    <div>🌅 Early Arrival (before 10 AM): +2 points</div>
-                    <div>⏰ Late Arrival (after 10:30 AM): -1 point</div>
-                    <div>💪 Overtime (per hour): +1 point</div>
-                    <div>🌾 Field Work/Warehouse: +10 points</div>
-                    <div>❌ Absent: -5 points</div>
-                    <div>🏆 Perfect Monthly Attendance: +20 points</div>
-                </div>
-            </div>
-            
-            <div class="date-selector">
-                <form method="GET">
-                    <label for="selected_date">Select Date:</label>
-                    <input type="date" id="selected_date" name="date" value="{{ selected_date }}" onchange="this.form.submit()">
-                </form>
-            </div>
-            
-            {% if is_sunday %}
-            <div class="sunday-notice">
-                <strong>Sunday - No Attendance Required</strong><br>
-                Sundays are off days. Please select a different date.
-            </div>
-            {% else %}
-            <form method="POST" action="/save_attendance">
-                <input type="hidden" name="date" value="{{ selected_date }}">
-                
-                <div class="attendance-grid">
-                    {% for staff in staff_members %}
-                    <div class="staff-card">
-                        <div class="staff-name">{{ staff }}</div>
-                        
-                        <div class="attendance-row">
-                            <div class="attendance-options">
-                                <label class="radio-option {% if attendance_data.get(staff, {}).get('status') == 'present' %}selected{% endif %}">
-                                    <input type="radio" name="{{ staff }}_status" value="present" 
-                                           {% if attendance_data.get(staff, {}).get('status') == 'present' %}checked{% endif %}
-                                           onchange="toggleTimeInputs('{{ staff }}', 'present')">
-                                    ✓ Office
-                                </label>
-                                <label class="radio-option {% if attendance_data.get(staff, {}).get('status') == 'field_work' %}selected{% endif %}">
-                                    <input type="radio" name="{{ staff }}_status" value="field_work"
-                                           {% if attendance_data.get(staff, {}).get('status') == 'field_work' %}checked{% endif %}
-                                           onchange="toggleTimeInputs('{{ staff }}', 'field_work')">
-                                    🌾 Field/Warehouse
-                                </label>
-                                <label class="radio-option {% if attendance_data.get(staff, {}).get('status') == 'absent' %}selected{% endif %}">
-                                    <input type="radio" name="{{ staff }}_status" value="absent"
-                                           {% if attendance_data.get(staff, {}).get('status') == 'absent' %}checked{% endif %}
-                                           onchange="toggleTimeInputs('{{ staff }}', 'absent')">
-                                    ✗ Absent
-                                </label>
-                            </div>
-                            
-                            <div class="duty-hours-display" id="{{ staff }}_hours_display">
-                                Duty Hours: <span id="{{ staff }}_hours">{{ "%.1f"|format(attendance_data.get(staff, {}).get('duty_hours', 0)) }}</span>h
-                            </div>
-                        </div>
-                        
-                        <div class="attendance-row" id="{{ staff }}_time_inputs" style="{% if attendance_data.get(staff, {}).get('status') != 'present' %}display: none;{% endif %}">
-                            <div class="time-input">
-                                <label>Entry Time:</label>
-                                <input type="time" name="{{ staff }}_entry_time" 
-                                       value="{{ attendance_data.get(staff, {}).get('entry_time', '') }}"
-                                       onchange="calculateHours('{{ staff }}')">
-                            </div>
-                            
-                            <div class="time-input">
-                                <label>Exit Time:</label>
-                                <input type="time" name="{{ staff }}_exit_time" 
-                                       value="{{ attendance_data.get(staff, {}).get('exit_time', '') }}"
-                                       onchange="calculateHours('{{ staff }}')">
-                            </div>
-                        </div>
-                        
-                        <div class="points-display" id="{{ staff }}_points_display">
-                            Points: <span id="{{ staff }}_points">{{ attendance_data.get(staff, {}).get('points', 0) }}</span>
-                        </div>
-                        
-                        <div class="remarks-section">
-                            <label>Remarks:</label>
-                            <textarea name="{{ staff }}_remarks" placeholder="Enter any remarks or notes...">{{ attendance_data.get(staff, {}).get('remarks', '') }}</textarea>
-                        </div>
-                    </div>
-                    {% endfor %}
-                </div>
-                
-                <button type="submit" class="btn btn-success">💾 Save Attendance</button>
-            </form>
-            {% endif %}
-            
-            <div class="reports-section">
-                <h3>📊 Download Reports</h3>
-                <div class="report-buttons">
-                    <a href="/download_daily_pdf?date={{ selected_date }}" class="btn">
-                        📄 Download Daily Report
-                    </a>
-                    <a href="/download_monthly_pdf?year={{ current_year }}&month={{ current_month }}" class="btn">
-                        📊 Download Monthly Report
-                    </a>
-                </div>
-            </div>
-        </div>
-    </div>
-
-    <script>
-        // Points configuration (matches Python backend)
-        const POINTS_CONFIG = {
-            'full_day_present': 10,
-            'half_day_present': 5,
-            'early_arrival': 2,
-            'late_arrival': -1,
-            'overtime': 1,
-            'absent': -5,
-            'field_work': 10
-        };
-
-        function toggleTimeInputs(staffName, status) {
-            const timeInputs = document.getElementById(staffName + '_time_inputs');
-            const hoursDisplay = document.getElementById(staffName + '_hours_display');
-            const hoursSpan = document.getElementById(staffName + '_hours');
-            const pointsSpan = document.getElementById(staffName + '_points');
-            
-            if (status === 'present') {
-                timeInputs.style.display = 'grid';
-                hoursDisplay.style.display = 'block';
-                calculateHours(staffName);
-            } else if (status === 'field_work') {
-                timeInputs.style.display = 'none';
-                hoursDisplay.style.display = 'block';
-                hoursSpan.textContent = '7.5';
-                pointsSpan.textContent = POINTS_CONFIG.field_work;
-            } else if (status === 'absent') {
-                timeInputs.style.display = 'none';
-                hoursDisplay.style.display = 'block';
-                hoursSpan.textContent = '0.0';
-                pointsSpan.textContent = POINTS_CONFIG.absent;
-            }
-        }
+        with workbook.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write(
+                b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+                b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+            )
+            sheet.write(('<row>' + ''.join(_xlsx_cell(column) for column in EXPORT_COLUMNS) + '</row>').encode('utf-8'))
+            for index, row in enumerate(rows, start=1):
+                sheet.write(('<row>' + ''.join(_xlsx_cell(value) for value in row) + '</row>').encode('utf-8'))
+                if index % EXPORT_BATCH_SIZE == 0:
+                    yield output.drain()
+            sheet.write(b'</sheetData></worksheet>')
+    yield output.drain()
 
-        function calculateHours(staffName) {
-            const entryTime = document.querySelector(`input[name="${staffName}_entry_time"]`).value;
-            const exitTime = document.querySelector(`input[name="${staffName}_exit_time"]`).value;
-            const hoursSpan = document.getElementById(staffName + '_hours');
-            const pointsSpan = document.getElementById(staffName + '_points');
-            
-            if (entryTime && exitTime) {
-                const entry = new Date(`2000-01-01 ${entryTime}`);
-                const exit = new Date(`2000-01-01 ${exitTime}`);
-                
-                let hours = (exit - entry) / (1000 * 60 * 60);
-                if (hours < 0) hours += 24; // Handle overnight shifts
-                
-                hoursSpan.textContent = hours.toFixed(1);
-                
-                // Calculate points
-                let points = 0;
-                if (hours >= 7.5) {
-                    points += POINTS_CONFIG.full_day_present;
-                    if (hours > 7.5) {
-                        points += Math.floor(hours - 7.5) * POINTS_CONFIG.overtime;
-                    }
-                } else if (hours >= 4) {
-                    points += POINTS_CONFIG.half_day_present;
-                }
-                
-                // Check for early/late arrival
-                const entryHour = entry.getHours();
-                const entryMinute = entry.getMinutes();
-                const entryDecimal = entryHour + entryMinute / 60;
-                
-                if (entryDecimal <= 10.0) {  // Before 10:00 AM
-                    points += POINTS_CONFIG.early_arrival;
-                } else if (entryDecimal > 10.5) {  // After 10:30 AM
-                    points += POINTS_CONFIG.late_arrival;
-                }
-                
-                pointsSpan.textContent = points > 0 ? '+' + points : points;
-            } else {
-                hoursSpan.textContent = '0.0';
-                pointsSpan.textContent = '0';
-            }
-        }
+def export_response(chunks, mimetype, filename):
+    """Stream an export generator as a file download"""
+    response = Response(chunks, mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+# Static assets are fingerprinted by content, so browsers may cache them for a year
+STATIC_MAX_AGE = 365 * 24 * 60 * 60
+
+@functools.lru_cache(maxsize=None)
+def get_asset_fingerprint(filename):
+    """Short content hash of a static file, computed once per process"""
+    with open(os.path.join(app.static_folder, filename), 'rb') as asset_file:
+        return hashlib.sha256(asset_file.read()).hexdigest()[:12]
+
+@app.template_global()
+def asset_url(filename):
+    """URL of a static file with its content fingerprint appended"""
+    return url_for('static', filename=filename, v=get_asset_fingerprint(filename))
+
+@app.after_request
+def add_static_cache_headers(response):
+    # Fingerprinted URLs change whenever the file does, so they never need revalidating
+    if request.endpoint == 'static' and request.args.get('v') and response.status_code == 200:
+        response.cache_control.public = True
+        response.cache_control.max_age = STATIC_MAX_AGE
+        response.cache_control.immutable = True
+        response.cache_control.no_cache = None
+    return response
+
+@app.after_request
+def schedule_pdf_warmup(response):
+    # Runs once the response has been sent, so the first request never waits for it
+    if PDF_WARMUP and _pdf_warmup_thread is None and _pdf_toolkit is None:
+        response.call_on_close(start_pdf_warmup)
+    return response
+
+def preload_templates():
+    """Compile page templates up front instead of on the first request"""
+    app.jinja_env.get_template('index.html')
 
-        // Add interactivity to radio options
-        document.querySelectorAll('.radio-option').forEach(option => {
-            option.addEventListener('click', function() {
-                const input = this.querySelector('input');
-                const staffName = input.name.replace('_status', '');
-                const status = input.value;
-                
-                // Remove selected class from other options for this staff
-                document.querySelectorAll(`input[name="${staffName}_status"]`).forEach(radio => {
-                    radio.closest('.radio-option').classList.remove('selected');
-                });
-                
-                // Add selected class to clicked option
-                this.classList.add('selected');
-                input.checked = true;
-                
-                // Toggle time inputs
-                toggleTimeInputs(staffName, status);
-            });
-        });
-
-        // Initialize on page load
-        document.addEventListener('DOMContentLoaded', function() {
-            {% for staff in staff_members %}
-            const status = "{{ attendance_data.get(staff, {}).get('status', '') }}";
-            if (status) {
-                toggleTimeInputs('{{ staff }}', status);
-            }
-            {% endfor %}
-        });
-    </script>
-</body>
-</html>
-'''
 
 @app.route('/')
 def index():
     today = datetime.now().strftime('%Y-%m-%d')
-    selected_date = request.args.get('date', today)
+    try:
+        selected_date = normalize_date(request.args.get('date', today))
+    except ValueError as error:
+        return str(error), 400
     
-    # Check if selected date is Sunday
-    is_sunday_date = is_sunday(selected_date)
+    # Sundays and holidays have no attendance
+    day_off_reason = get_day_off_reason(selected_date)
     
     # Get attendance data for selected date
     attendance_data = get_attendance_for_date(selected_date)
@@ -1136,26 +2987,32 @@ def index():
     
     success_message = request.args.get('success')
     
-    return render_template_string(HTML_TEMPLATE,
-                                staff_members=STAFF_MEMBERS,
+    return render_template('index.html',
+                                staff_members=get_staff_members(),
+                                branch=get_current_branch(),
+                                branches=BRANCHES,
                                 selected_date=selected_date,
                                 current_date_formatted=current_date_formatted,
-                                is_sunday=is_sunday_date,
+                                day_off_reason=day_off_reason,
                                 attendance_data=attendance_data,
                                 success_message=success_message,
                                 current_year=datetime.now().year,
-                                current_month=datetime.now().month)
+                                current_month=datetime.now().month,
+                                points_config=POINTS_CONFIG)
 
 @app.route('/save_attendance', methods=['POST'])
 def save_attendance_route():
-    date_str = request.form.get('date')
+    try:
+        date_str = normalize_date(request.form.get('date'))
+    except ValueError as error:
+        return str(error), 400
     
-    # Don't save attendance for Sundays
-    if is_sunday(date_str):
-        return redirect(url_for('index', date=date_str))
+    # Don't save attendance for Sundays or holidays
+    if not is_working_day(date_str):
+        return redirect(url_for('index', date=date_str, branch=get_current_branch()))
     
     attendance_data = {}
-    for staff in STAFF_MEMBERS:
+    for staff in get_staff_members():
         status = request.form.get(f'{staff}_status')
         entry_time = request.form.get(f'{staff}_entry_time')
         exit_time = request.form.get(f'{staff}_exit_time')
@@ -1171,45 +3028,403 @@ def save_attendance_route():
     
     save_attendance(date_str, attendance_data)
     
-    return redirect(url_for('index', date=date_str, success='Attendance saved successfully with points calculated!'))
+    return redirect(url_for('index', date=date_str, branch=get_current_branch(),
+                            success='Attendance saved successfully with points calculated!'))
 
-@app.route('/download_daily_pdf')
-def download_daily_pdf():
-    date_str = request.args.get('date', datetime.now().strftime('%Y-%m-%d'))
+@app.route('/save_staff_attendance', methods=['POST'])
+def save_staff_attendance_route():
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'success': False, 'error': 'A JSON object is required'}), 400
+    staff_name = data.get('staff_name')
+    status = data.get('status')
     
-    if is_sunday(date_str):
-        return "No attendance report available for Sundays", 400
+    try:
+        date_str = normalize_date(data.get('date'))
+        day_off_reason = get_day_off_reason(date_str)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'A valid date (YYYY-MM-DD) is required'}), 400
+    if day_off_reason == 'Sunday':
+        return jsonify({'success': False, 'error': 'Sundays are off days'}), 400
+    if day_off_reason is not None:
+        return jsonify({'success': False, 'error': f'{date_str} is a holiday ({day_off_reason})'}), 400
+    if staff_name not in get_staff_members():
+        return jsonify({'success': False, 'error': f'Unknown staff member: {staff_name}'}), 400
+    if status not in ATTENDANCE_STATUSES:
+        return jsonify({'success': False, 'error': f'Unknown status: {status}'}), 400
     
-    pdf_buffer = generate_daily_pdf(date_str)
+    changed, row = save_staff_attendance(date_str, staff_name, {
+        'status': status,
+        'entry_time': data.get('entry_time') if status == 'present' else None,
+        'exit_time': data.get('exit_time') if status == 'present' else None,
+        'remarks': data.get('remarks') or ''
+    })
     
-    filename = f"attendance_daily_{date_str}.pdf"
+    return jsonify({
+        'success': True,
+        'changed': changed,
+        'staff_name': staff_name,
+        'date': date_str,
+        'duty_hours': row['duty_hours'],
+        'points': row['points']
+    })
+
+@app.route('/sync_attendance', methods=['POST'])
+def sync_attendance_route():
+    data = request.get_json(silent=True) or {}
+    if not isinstance(data, dict):
+        return jsonify({'success': False, 'error': 'A JSON object is required'}), 400
+    changes = data.get('changes')
+    if not isinstance(changes, list):
+        return jsonify({'success': False, 'error': 'A list of changes is required'}), 400
+    if len(changes) > SYNC_MAX_CHANGES:
+        return jsonify({'success': False, 'error': f'At most {SYNC_MAX_CHANGES} changes per request'}), 413
     
-    return send_file(
-        pdf_buffer,
-        as_attachment=True,
-        download_name=filename,
-        mimetype='application/pdf'
-    )
+    results = sync_attendance(changes, data.get('sent_at'))
+    counts = {}
+    for result in results:
+        counts[result['result']] = counts.get(result['result'], 0) + 1
+    return jsonify({'success': True, 'results': results, 'counts': counts, 'server_time': int(time.time())})
+
+@app.route('/service-worker.js')
+def service_worker():
+    # Served from the root so the worker's scope covers the check-in page
+    response = app.send_static_file('service-worker.js')
+    response.cache_control.no_cache = True
+    response.cache_control.max_age = 0
+    return response
+
+@app.route('/download_daily_pdf')
+def download_daily_pdf():
+    try:
+        period, build_pdf, filename = get_report_spec('daily', request.args)
+    except ValueError as error:
+        return str(error), 400
+    
+    return send_cached_pdf('daily', period, build_pdf, filename)
 
 @app.route('/download_monthly_pdf')
 def download_monthly_pdf():
-    year = int(request.args.get('year', datetime.now().year))
-    month = int(request.args.get('month', datetime.now().month))
+    try:
+        period, build_pdf, filename = get_report_spec('monthly', request.args)
+    except ValueError as error:
+        return str(error), 400
     
-    pdf_buffer = generate_monthly_pdf(year, month)
+    return send_cached_pdf('monthly', period, build_pdf, filename)
+
+@app.route('/download_yearly_pdf')
+def download_yearly_pdf():
+    try:
+        period, build_pdf, filename = get_report_spec('yearly', request.args)
+    except ValueError as error:
+        return str(error), 400
     
-    filename = f"attendance_monthly_{year}_{month:02d}.pdf"
+    return send_cached_pdf('yearly', period, build_pdf, filename)
+
+@app.route('/download_range_pdf')
+def download_range_pdf():
+    try:
+        period, build_pdf, filename = get_report_spec('range', request.args)
+    except ValueError as error:
+        return str(error), 400
     
-    return send_file(
-        pdf_buffer,
-        as_attachment=True,
-        download_name=filename,
-        mimetype='application/pdf'
+    return send_cached_pdf('range', period, build_pdf, filename)
+
+@app.route('/yearly_stats')
+def yearly_stats():
+    try:
+        year = get_year_param(request.args.get('year'))
+    except ValueError as error:
+        return jsonify({'success': False, 'error': str(error)}), 400
+    
+    return jsonify(get_yearly_stats(year))
+
+@app.route('/range_stats')
+def range_stats():
+    try:
+        start_date, end_date = get_date_range_params(request.args)
+    except ValueError as error:
+        return jsonify({'success': False, 'error': str(error)}), 400
+    
+    return jsonify(get_range_stats(start_date, end_date))
+
+@app.route('/leaderboard')
+def leaderboard():
+    try:
+        start_date, end_date = get_leaderboard_period(request.args)
+    except ValueError as error:
+        return jsonify({'success': False, 'error': str(error)}), 400
+    
+    return jsonify(get_leaderboard(start_date, end_date))
+
+@app.route('/holidays', methods=['GET', 'POST'])
+def holidays_route():
+    if request.method == 'GET':
+        try:
+            year = get_year_param(request.args.get('year'))
+        except ValueError as error:
+            return jsonify({'success': False, 'error': str(error)}), 400
+        return jsonify({'year': year, 'holidays': get_holidays(year)})
+    
+    data = request.get_json(silent=True) or request.form.to_dict()
+    if not isinstance(data, dict):
+        return jsonify({'success': False, 'error': 'A JSON object is required'}), 400
+    name = (data.get('name') or '').strip()
+    try:
+        date_str = normalize_date(data.get('date'))
+        if is_sunday(date_str):
+            return jsonify({'success': False, 'error': 'Sundays are already off days'}), 400
+    except ValueError:
+        return jsonify({'success': False, 'error': 'A valid date (YYYY-MM-DD) is required'}), 400
+    if not name:
+        return jsonify({'success': False, 'error': 'A holiday name is required'}), 400
+    
+    set_holiday(date_str, name)
+    return jsonify({'success': True, 'date': date_str, 'name': name})
+
+@app.route('/holidays/<date_str>', methods=['DELETE'])
+def delete_holiday(date_str):
+    try:
+        date_str = normalize_date(date_str)
+    except ValueError:
+        return jsonify({'success': False, 'error': 'A valid date (YYYY-MM-DD) is required'}), 400
+    
+    set_holiday(date_str, None)
+    return jsonify({'success': True, 'date': date_str})
+
+@app.route('/branch_summary')
+def branch_summary():
+    try:
+        start_date, end_date = get_date_range_params(request.args)
+    except ValueError as error:
+        return jsonify({'success': False, 'error': str(error)}), 400
+    
+    return jsonify(get_branch_summary(start_date, end_date))
+
+@app.route('/import_punches', methods=['POST'])
+def import_punches():
+    upload = request.files.get('file')
+    if upload is None:
+        return jsonify({'success': False, 'error': 'Upload the punch log as "file"'}), 400
+    
+    lines = io.TextIOWrapper(upload.stream, encoding='utf-8-sig', errors='replace', newline='')
+    try:
+        summary = import_punch_log(lines)
+    except ValueError as error:
+        return jsonify({'success': False, 'error': str(error)}), 400
+    return jsonify(dict(summary, success=True))
+
+@app.route('/export_csv')
+def export_csv():
+    try:
+        start_date, end_date = get_date_range_params(request.args)
+    except ValueError as error:
+        return str(error), 400
+    
+    rows = iter_attendance_export(start_date, end_date, request.args.getlist('staff'))
+    return export_response(iter_csv_export(rows), 'text/csv', f"attendance_{start_date}_to_{end_date}.csv")
+
+@app.route('/export_xlsx')
+def export_xlsx():
+    try:
+        start_date, end_date = get_date_range_params(request.args)
+    except ValueError as error:
+        return str(error), 400
+    
+    rows = iter_attendance_export(start_date, end_date, request.args.getlist('staff'))
+    return export_response(
+        iter_xlsx_export(rows),
+        'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        f"attendance_{start_date}_to_{end_date}.xlsx"
     )
 
-if __name__ == '__main__':
+@app.route('/report_jobs', methods=['POST'])
+def submit_report_job_route():
+    params = request.get_json(silent=True) or request.form.to_dict()
+    if not isinstance(params, dict):
+        return jsonify({'success': False, 'error': 'A JSON object is required'}), 400
+    try:
+        job_id = submit_report_job(params.get('type'), params)
+    except ValueError as error:
+        return jsonify({'success': False, 'error': str(error)}), 400
+    
+    job = get_report_job(job_id)
+    job['status_url'] = url_for('report_job_status', job_id=job_id)
+    return jsonify(job), 202
+
+@app.route('/report_jobs/<job_id>')
+def report_job_status(job_id):
+    job = get_report_job(job_id)
+    if job is None:
+        return jsonify({'success': False, 'error': 'Unknown report job'}), 404
+    
+    if job['status'] == 'done':
+        job['download_url'] = url_for('download_report_job', job_id=job_id)
+    return jsonify(job)
+
+@app.route('/report_jobs/<job_id>/download')
+def download_report_job(job_id):
+    job = get_report_job(job_id)
+    if job is None:
+        return "Unknown report job", 404
+    if job['status'] != 'done':
+        return f"Report job is {job['status']}", 409
+    
+    # Served through the PDF cache, so an evicted file is simply rendered again
+    with use_branch(job['branch']):
+        period, build_pdf, filename = get_report_spec(job['type'], job['params'])
+        return send_cached_pdf(job['type'], period, build_pdf, filename)
+
+@app.route('/metrics')
+def metrics():
+    body = '\n\n'.join(metric.render() for metric in METRICS) + '\n'
+    return Response(body, mimetype='text/plain; version=0.0.4')
+
+def create_app(init_database=True):
+    """Prepare the app for serving: create or migrate every branch database and compile templates.
+    
+    Routes are registered on the module-level app at import, so this returns that
+    app; servers that fork call it once in the parent process.
+    """
+    if init_database:
+        init_db()
+        # SQLite connections must not cross a fork, so workers open their own
+        close_db_connection()
+    preload_templates()
+    return app
+
+def reset_worker_state():
+    """Drop per-process state inherited from the parent after a worker process forks"""
+    global _db_local, _branch_executor, _report_executor, _pdf_warmup_thread
+    # Forget (rather than close) any inherited connections, closing them could disturb the parent's locks
+    _db_local = threading.local()
+    _branch_executor = None
+    _report_executor = None
+    _pdf_warmup_thread = None
+    with _report_jobs_lock:
+        _report_jobs.clear()
+        _report_job_keys.clear()
+
+def finish_worker_jobs():
+    """On worker shutdown, wait for running report jobs and mark queued ones as failed"""
+    executor = _report_executor
+    if executor is None:
+        return
+    executor.shutdown(wait=True, cancel_futures=True)
+    with _report_jobs_lock:
+        jobs = list(_report_jobs.items())
+    for job_id, job in jobs:
+        if job['future'].cancelled():
+            write_report_job_record(job_id, job, 'failed', REPORT_JOB_CANCELLED_ERROR)
+
+def run_production_server(host, port, workers, threads, pidfile=None):
+    """Serve the app with gunicorn: set up once in the master, then fork worker processes.
+    
+    SIGHUP to the master restarts workers gracefully (in-flight requests finish
+    first); SIGUSR2 followed by SIGTERM to the old master deploys new code.
+    """
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise click.ClickException('The production server needs gunicorn: pip install gunicorn')
+    
+    def on_starting(arbiter):
+        create_app()
+        if PDF_WARMUP:
+            # Workers inherit the loaded PDF toolkit instead of each importing it
+            get_pdf_toolkit()
+    
+    options = {
+        'bind': f'{host}:{port}',
+        'workers': workers,
+        'threads': threads,
+        'worker_class': 'gthread',
+        'timeout': SERVER_CONFIG['timeout'],
+        'graceful_timeout': SERVER_CONFIG['graceful_timeout'],
+        'max_requests': SERVER_CONFIG['max_requests'],
+        'max_requests_jitter': SERVER_CONFIG['max_requests'] // 10,
+        'preload_app': True,
+        'on_starting': on_starting,
+        # A graceful restart re-runs migrations, new workers then fork from the master
+        'on_reload': lambda arbiter: create_app(),
+        'post_fork': lambda arbiter, worker: reset_worker_state(),
+        'worker_exit': lambda arbiter, worker: finish_worker_jobs(),
+    }
+    if pidfile:
+        options['pidfile'] = pidfile
+    
+    class AttendanceServer(BaseApplication):
+        def load_config(self):
+            for name, value in options.items():
+                self.cfg.set(name, value)
+        
+        def load(self):
+            return app
+    
+    AttendanceServer().run()
+
+@app.cli.command('serve')
+@click.option('--host', default='0.0.0.0', show_default=True)
+@click.option('--port', default=5000, show_default=True)
+@click.option('--workers', default=SERVER_CONFIG['workers'], show_default=True, help='worker processes')
+@click.option('--threads', default=SERVER_CONFIG['threads'], show_default=True, help='request threads per worker')
+@click.option('--pidfile', help='write the master process id here (for kill -HUP)')
+def serve_command(host, port, workers, threads, pidfile):
+    """Run the production server with several worker processes"""
+    run_production_server(host, port, workers, threads, pidfile)
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    """Fail if any report query does a full table scan of attendance"""
+    init_db()
+    conn = get_db_connection()
+    full_scans = check_query_plans(conn)
+    
+    for name, details in full_scans.items():
+        print(f"{name}: full table scan ({'; '.join(details)})")
+    if full_scans:
+        raise SystemExit(1)
+    print(f"All {len(REPORT_QUERIES)} report queries use an index")
+
+@app.cli.command('import-punches')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--branch', type=click.Choice(list(BRANCHES)), default=DEFAULT_BRANCH, show_default=True)
+def import_punches_command(path, branch):
+    """Import a biometric punch log CSV"""
+    init_db()
+    with open(path, encoding='utf-8-sig', errors='replace', newline='') as punch_log, use_branch(branch):
+        summary = import_punch_log(punch_log)
+    
+    for item in summary['rejected']:
+        print(f"line {item['line']}: {item['reason']}")
+    print(f"{summary['lines']} punches, {summary['days']} days: {summary['written']} written, "
+          f"{summary['unchanged']} unchanged, {summary['rejected_count']} rejected")
+
+@app.cli.command('check-month-totals')
+@click.option('--repair', is_flag=True, help='Rebuild the totals if they differ')
+def check_month_totals_command(repair):
+    """Diff every branch's trigger-maintained monthly totals against a rebuild from attendance rows"""
     init_db()
-    app.run(debug=True, host='0.0.0.0', port=5000)
+    failed = False
+    for branch in BRANCHES:
+        with use_branch(branch):
+            conn = get_db_connection()
+            differences = check_month_totals(conn)
+            
+            for (month, staff_id), (stored, rebuilt) in sorted(differences.items()):
+                print(f"{branch} {month} {get_staff_name(conn, staff_id)}: stored {stored}, rebuilt {rebuilt}")
+            if not differences:
+                print(f"{branch}: monthly totals match the attendance rows")
+            elif repair:
+                rebuild_month_totals(conn)
+                print(f"{branch}: rebuilt monthly totals ({len(differences)} rows differed)")
+            else:
+                failed = True
+    if failed:
+        raise SystemExit(1)
+
+if __name__ == '__main__':
+    create_app().run(debug=True, host='0.0.0.0', port=5000)
 
 
     
\ No newline at end of file
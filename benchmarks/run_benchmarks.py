@@ -0,0 +1,344 @@
+"""Benchmark suite for the attendance app.
+
+Fills a throwaway database with N staff x M years of synthetic attendance,
+times the report functions and Flask routes, and prints the results as JSON.
+
+    python benchmarks/run_benchmarks.py --staff 50 --years 2 --output results.json
+    python benchmarks/run_benchmarks.py --save-baseline benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --baseline benchmarks/baseline.json --threshold 0.25
+
+With --baseline the run exits with status 1 if any benchmark's median is
+more than --threshold slower than the stored one.
+
+Cold start is timed in fresh interpreters: 'startup.import_app' is the time
+to import the app module, and the report's 'import_breakdown' lists the
+slowest top-level packages from a `python -X importtime` run.
+"""
+import argparse
+import importlib.util
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Daily-Attendence-Final.py')
+
+# Run in a fresh interpreter: prints the app import time in ms and the heavy packages it pulled in
+STARTUP_SCRIPT = '''
+import importlib.util, sys, time
+started = time.perf_counter()
+spec = importlib.util.spec_from_file_location('attendance_app', sys.argv[1])
+module = importlib.util.module_from_spec(spec)
+sys.modules['attendance_app'] = module
+spec.loader.exec_module(module)
+print((time.perf_counter() - started) * 1000)
+print(','.join(name for name in ('reportlab', 'numpy') if name in sys.modules))
+'''
+
+
+def load_app(work_dir):
+    """Import the app module from its file, pointed at a database and PDF cache in work_dir"""
+    spec = importlib.util.spec_from_file_location('attendance_app', APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['attendance_app'] = module
+    spec.loader.exec_module(module)
+    module.DATABASE_PATH = os.path.join(work_dir, 'attendance.db')
+    module.PDF_CACHE_DIR = os.path.join(work_dir, 'pdf_cache')
+    module.app.logger.disabled = True
+    return module
+
+
+def random_record(rng):
+    """One realistic attendance entry: mostly office days around 10:00, some field work and absences"""
+    roll = rng.random()
+    if roll < 0.08:
+        return {'status': 'absent', 'remarks': rng.choice(['', 'Sick leave', 'Family emergency'])}
+    if roll < 0.20:
+        return {'status': 'field_work', 'remarks': rng.choice(['', 'Warehouse stock count', 'Client visit'])}
+    entry = 9 * 60 + 15 + int(rng.gauss(45, 25))
+    exit = entry + int(rng.gauss(8 * 60, 60))
+    return {
+        'status': 'present',
+        'entry_time': f'{(entry // 60) % 24:02d}:{entry % 60:02d}',
+        'exit_time': f'{(exit // 60) % 24:02d}:{exit % 60:02d}',
+        'remarks': rng.choice(['', '', '', 'Left early for bank work', 'Stayed late for month end'])
+    }
+
+
+def generate_data(app_module, staff_count, years, end_date, seed=42):
+    """Fill the database with staff_count staff over the given number of years ending at end_date"""
+    rng = random.Random(seed)
+    app_module.STAFF_MEMBERS[:] = [f'Staff Member {index:03d}' for index in range(staff_count)]
+    app_module.init_db()
+
+    day = date(end_date.year - years + 1, 1, 1)
+    batch = {}
+    rows = 0
+    while day <= end_date:
+        if day.weekday() != 6:
+            batch[day.isoformat()] = {staff: random_record(rng) for staff in app_module.STAFF_MEMBERS}
+        # Write a month at a time to keep the generator's memory small
+        if batch and (day + timedelta(days=1)).day == 1:
+            rows += app_module.save_attendance_bulk(batch)
+            batch = {}
+        day += timedelta(days=1)
+    if batch:
+        rows += app_module.save_attendance_bulk(batch)
+    return rows
+
+
+def measure(func, repeat, setup=None):
+    """Run func repeat times (after an optional per-run setup) and summarise in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        'median_ms': round(statistics.median(timings), 3),
+        'min_ms': round(min(timings), 3),
+        'max_ms': round(max(timings), 3),
+        'runs': repeat
+    }
+
+
+def run_startup(work_dir, *options):
+    """Import the app in a new interpreter, returning (import ms, loaded heavy packages, stderr)"""
+    result = subprocess.run(
+        [sys.executable, *options, '-c', STARTUP_SCRIPT, APP_PATH],
+        cwd=work_dir, capture_output=True, text=True, check=True
+    )
+    import_ms, loaded = result.stdout.splitlines()[-2:]
+    return float(import_ms), [name for name in loaded.split(',') if name], result.stderr
+
+
+def parse_importtime(stderr, top=15):
+    """Cumulative import time in ms per top-level package from `python -X importtime` output"""
+    packages = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Top-level imports are indented one space, nested ones two more per level
+        package = name.strip().split('.')[0]
+        if len(name) - len(name.lstrip()) == 1:
+            packages[package] = packages.get(package, 0) + int(cumulative) / 1000
+    slowest = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {package: round(ms, 1) for package, ms in slowest}
+
+
+def run_startup_benchmarks(work_dir, repeat):
+    """Time cold imports of the app and break one of them down by package"""
+    timings = []
+    for _ in range(repeat):
+        import_ms, loaded, _ = run_startup(work_dir)
+        timings.append(import_ms)
+    _, _, stderr = run_startup(work_dir, '-X', 'importtime')
+    result = {
+        'median_ms': round(statistics.median(timings), 3),
+        'min_ms': round(min(timings), 3),
+        'max_ms': round(max(timings), 3),
+        'runs': repeat
+    }
+    return result, {'loaded_at_import': loaded, 'packages_ms': parse_importtime(stderr)}
+
+
+def run_benchmarks(app_module, end_date, repeat):
+    """Time every report function and route against the generated data"""
+    module = app_module
+    client = module.app.test_client()
+    staff = module.STAFF_MEMBERS
+    year, month = end_date.year, end_date.month
+    day = end_date - timedelta(days=1) if end_date.weekday() == 6 else end_date
+    day_str = day.isoformat()
+    # A day after the generated data for the holiday write benchmark, so other reports keep their days
+    holiday = day + timedelta(days=2 if day.weekday() == 5 else 1)
+    rng = random.Random(7)
+
+    def clear_caches():
+        module.invalidate_monthly_stats()
+        module._leaderboard_cache.clear()
+        with module._report_jobs_lock:
+            module._report_jobs.clear()
+            module._report_job_keys.clear()
+        shutil.rmtree(module.PDF_CACHE_DIR, ignore_errors=True)
+
+    def day_sheet():
+        return {name: random_record(rng) for name in staff}
+
+    def form_data():
+        data = {'date': day_str}
+        for name, record in day_sheet().items():
+            data[f'{name}_status'] = record['status']
+            data[f'{name}_entry_time'] = record.get('entry_time', '')
+            data[f'{name}_exit_time'] = record.get('exit_time', '')
+            data[f'{name}_remarks'] = record['remarks']
+        return data
+
+    def staff_json():
+        return dict(random_record(rng), date=day_str, staff_name=rng.choice(staff))
+
+    def sync_json():
+        # A day's sheet queued offline, as the check-in page sends it after reconnecting
+        edited_at = int(time.time())
+        changes = [dict(record, date=day_str, staff_name=name, updated_at=edited_at)
+                   for name, record in day_sheet().items()]
+        return {'changes': changes, 'sent_at': edited_at}
+
+    def punch_log():
+        # A biometric export of the day: an in and an out punch per staff member
+        lines = ['name,timestamp']
+        for name, record in day_sheet().items():
+            if record['status'] == 'present':
+                for punch_time in (record['entry_time'], record['exit_time']):
+                    lines.append(f"{name},{day.strftime('%d/%m/%Y')} {punch_time}")
+        return {'file': (io.BytesIO('\n'.join(lines).encode()), 'punches.csv')}
+
+    def get(url):
+        response = client.get(url)
+        response.get_data()
+        assert response.status_code == 200, (url, response.status_code)
+
+    def send(method, url, status=200, **kwargs):
+        response = client.open(url, method=method, **kwargs)
+        response.get_data()
+        assert response.status_code == status, (url, response.status_code, response.get_data(as_text=True)[:200])
+        return response
+
+    def report_job():
+        # Submit, poll until rendered, then download, as the report buttons do
+        status_url = send('POST', '/report_jobs', 202, json={'type': 'monthly', 'year': year, 'month': month}).get_json()['status_url']
+        job = client.get(status_url).get_json()
+        while job['status'] in ('queued', 'running'):
+            time.sleep(0.002)
+            job = client.get(status_url).get_json()
+        assert job['status'] == 'done', job
+        get(job['download_url'])
+
+    def set_and_delete_holiday():
+        send('POST', '/holidays', json={'date': holiday.isoformat(), 'name': 'Benchmark Holiday'})
+        send('DELETE', f'/holidays/{holiday.isoformat()}')
+
+    results = {}
+    benchmarks = [
+        ('get_attendance_for_date', lambda: module.get_attendance_for_date(day_str), None),
+        ('save_attendance', lambda: module.save_attendance(day_str, day_sheet()), None),
+        ('get_monthly_stats.cold', lambda: module.get_monthly_stats(year, month), clear_caches),
+        ('get_monthly_stats.warm', lambda: module.get_monthly_stats(year, month), None),
+        ('get_yearly_stats.cold', lambda: module.get_yearly_stats(year), clear_caches),
+        ('generate_daily_pdf', lambda: module.generate_daily_pdf(day_str), None),
+        ('generate_monthly_pdf', lambda: module.generate_monthly_pdf(year, month), clear_caches),
+        ('route.index', lambda: get(f'/?date={day_str}'), None),
+        ('route.save_attendance', lambda: send('POST', '/save_attendance', 302, data=form_data()), None),
+        ('route.save_staff_attendance', lambda: send('POST', '/save_staff_attendance', json=staff_json()), None),
+        ('route.sync_attendance', lambda: send('POST', '/sync_attendance', json=sync_json()), None),
+        ('route.import_punches', lambda: send('POST', '/import_punches', data=punch_log()), None),
+        ('route.download_daily_pdf.cold', lambda: get(f'/download_daily_pdf?date={day_str}'), clear_caches),
+        ('route.download_daily_pdf.warm', lambda: get(f'/download_daily_pdf?date={day_str}'), None),
+        ('route.download_monthly_pdf.cold', lambda: get(f'/download_monthly_pdf?year={year}&month={month}'), clear_caches),
+        ('route.download_monthly_pdf.warm', lambda: get(f'/download_monthly_pdf?year={year}&month={month}'), None),
+        ('route.report_jobs.monthly', report_job, clear_caches),
+        ('route.yearly_stats', lambda: get(f'/yearly_stats?year={year}'), None),
+        ('route.range_stats', lambda: get(f'/range_stats?start={year}-01-15&end={day_str}'), None),
+        ('route.branch_summary', lambda: get(f'/branch_summary?start={year}-01-01&end={day_str}'), None),
+        ('route.download_range_pdf.cold', lambda: get(f'/download_range_pdf?start={year}-01-15&end={day_str}'), clear_caches),
+        ('route.holidays', lambda: get(f'/holidays?year={year}'), None),
+        ('route.leaderboard.cold', lambda: get(f'/leaderboard?year={year}'), clear_caches),
+        ('route.leaderboard.warm', lambda: get(f'/leaderboard?year={year}'), None),
+        ('route.download_yearly_pdf.cold', lambda: get(f'/download_yearly_pdf?year={year}'), clear_caches),
+        ('route.export_csv.year', lambda: get(f'/export_csv?start={year}-01-01&end={year}-12-31'), None),
+        ('route.export_xlsx.year', lambda: get(f'/export_xlsx?start={year}-01-01&end={year}-12-31'), None),
+        ('route.metrics', lambda: get('/metrics'), None),
+        # Last: holiday writes invalidate the month's cached reports
+        ('route.holidays.set_and_delete', set_and_delete_holiday, None),
+    ]
+    for name, func, setup in benchmarks:
+        # One untimed run so warm benchmarks really are warm
+        if setup is None:
+            func()
+        results[name] = measure(func, repeat, setup)
+    return results
+
+
+def compare(results, baseline, threshold):
+    """Return {name: ratio} for benchmarks whose median regressed beyond the threshold"""
+    regressions = {}
+    for name, stats in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if not previous or not previous['median_ms']:
+            continue
+        ratio = stats['median_ms'] / previous['median_ms']
+        if ratio > 1 + threshold:
+            regressions[name] = round(ratio, 3)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--staff', type=int, default=25, help='number of synthetic staff members')
+    parser.add_argument('--years', type=int, default=1, help='years of attendance history to generate')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per benchmark')
+    parser.add_argument('--end-date', default=None, help='last day of generated data (YYYY-MM-DD, default today)')
+    parser.add_argument('--output', help='write results JSON to this file as well as stdout')
+    parser.add_argument('--save-baseline', help='store the results as the baseline at this path')
+    parser.add_argument('--baseline', help='compare against the baseline stored at this path')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown before flagging (0.25 = 25%%)')
+    args = parser.parse_args(argv)
+
+    end_date = datetime.strptime(args.end_date, '%Y-%m-%d').date() if args.end_date else date.today()
+    work_dir = tempfile.mkdtemp(prefix='attendance-bench-')
+    try:
+        startup, import_breakdown = run_startup_benchmarks(work_dir, args.repeat)
+        app_module = load_app(work_dir)
+        started = time.perf_counter()
+        rows = generate_data(app_module, args.staff, args.years, end_date)
+        generate_seconds = time.perf_counter() - started
+
+        report = {
+            'meta': {
+                'staff': args.staff,
+                'years': args.years,
+                'rows': rows,
+                'repeat': args.repeat,
+                'end_date': end_date.isoformat(),
+                'generate_seconds': round(generate_seconds, 3),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'timestamp': datetime.now().isoformat(timespec='seconds'),
+            },
+            'results': dict(run_benchmarks(app_module, end_date, args.repeat), **{'startup.import_app': startup}),
+            'import_breakdown': import_breakdown,
+        }
+        app_module.close_db_connection()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = json.dumps(report, indent=2)
+    print(output)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as output_file:
+                output_file.write(output + '\n')
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(report['results'], json.load(baseline_file), args.threshold)
+        for name, ratio in sorted(regressions.items()):
+            print(f'REGRESSION {name}: {ratio:.2f}x baseline median', file=sys.stderr)
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,117 @@
+// Offline edit queue shared by the check-in page and the service worker.
+// Edits are kept in IndexedDB (one entry per branch, date and staff member, so a
+// newer edit replaces an unsent older one) and sent to /sync_attendance in batches.
+const SYNC_DB_NAME = 'attendance-sync';
+const SYNC_STORE = 'changes';
+const SYNC_URL = '/sync_attendance';
+const SYNC_BATCH_SIZE = 200;
+
+function openSyncDatabase() {
+    return new Promise((resolve, reject) => {
+        const request = indexedDB.open(SYNC_DB_NAME, 1);
+        request.onupgradeneeded = () => {
+            request.result.createObjectStore(SYNC_STORE, {keyPath: 'key'});
+        };
+        request.onsuccess = () => resolve(request.result);
+        request.onerror = () => reject(request.error);
+    });
+}
+
+// Run fn(store) in one transaction and resolve with its request's result
+function withSyncStore(mode, fn) {
+    return openSyncDatabase().then(db => new Promise((resolve, reject) => {
+        const transaction = db.transaction(SYNC_STORE, mode);
+        const request = fn(transaction.objectStore(SYNC_STORE));
+        transaction.oncomplete = () => {
+            db.close();
+            resolve(request ? request.result : undefined);
+        };
+        transaction.onerror = () => {
+            db.close();
+            reject(transaction.error);
+        };
+    }));
+}
+
+// Queue an edit; updated_at records when it was made (Unix seconds, as the server expects)
+// and queued_at the same in milliseconds, which tells two quick edits of one entry apart
+function queueAttendanceChange(change) {
+    const now = Date.now();
+    const entry = Object.assign({}, change, {
+        key: `${change.branch}|${change.date}|${change.staff_name}`,
+        updated_at: Math.floor(now / 1000),
+        queued_at: now
+    });
+    return withSyncStore('readwrite', store => store.put(entry));
+}
+
+function getQueuedChanges() {
+    return withSyncStore('readonly', store => store.getAll());
+}
+
+// Forget sent edits, unless they were edited again while the batch was in flight
+function removeSentChanges(sent) {
+    return withSyncStore('readwrite', store => {
+        sent.forEach(change => {
+            const request = store.get(change.key);
+            request.onsuccess = () => {
+                if (request.result && request.result.queued_at === change.queued_at) {
+                    store.delete(change.key);
+                }
+            };
+        });
+    });
+}
+
+function postChangeBatch(branch, batch) {
+    const changes = batch.map(change => ({
+        date: change.date,
+        staff_name: change.staff_name,
+        status: change.status,
+        entry_time: change.entry_time,
+        exit_time: change.exit_time,
+        remarks: change.remarks,
+        updated_at: change.updated_at
+    }));
+    return fetch(`${SYNC_URL}?branch=${encodeURIComponent(branch)}`, {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify({changes: changes, sent_at: Math.floor(Date.now() / 1000)})
+    }).then(response => {
+        if (!response.ok) {
+            throw new Error(`Sync failed with status ${response.status}`);
+        }
+        return response.json();
+    });
+}
+
+// Send every queued edit, a batch at a time per branch, and resolve with the results
+// (each {date, staff_name, result, record}, with the branch added). Rejects if offline;
+// batches already sent stay sent.
+let activeFlush = null;
+
+function flushAttendanceChanges() {
+    if (activeFlush) {
+        return activeFlush;
+    }
+    activeFlush = getQueuedChanges().then(async queued => {
+        const byBranch = {};
+        queued.forEach(change => {
+            (byBranch[change.branch] = byBranch[change.branch] || []).push(change);
+        });
+
+        const results = [];
+        for (const [branch, changes] of Object.entries(byBranch)) {
+            for (let start = 0; start < changes.length; start += SYNC_BATCH_SIZE) {
+                const batch = changes.slice(start, start + SYNC_BATCH_SIZE);
+                const response = await postChangeBatch(branch, batch);
+                await removeSentChanges(batch);
+                response.results.forEach(result => results.push(Object.assign({branch: branch}, result)));
+            }
+        }
+        return results;
+    }).finally(() => {
+        activeFlush = null;
+    });
+    return activeFlush;
+}
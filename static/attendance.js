@@ -0,0 +1,370 @@
+// Points configuration, rendered from the Python backend's POINTS_CONFIG
+const POINTS_CONFIG = JSON.parse(document.body.dataset.pointsConfig);
+
+function getStaffCard(staffName) {
+    return document.querySelector(`.staff-card[data-staff="${CSS.escape(staffName)}"]`);
+}
+
+function toggleTimeInputs(staffName, status) {
+    const card = getStaffCard(staffName);
+    const timeInputs = card.querySelector('.time-inputs');
+    const hoursDisplay = card.querySelector('.duty-hours-display');
+    const hoursSpan = card.querySelector('.duty-hours');
+    const pointsSpan = card.querySelector('.points');
+    
+    if (status === 'present') {
+        timeInputs.style.display = 'grid';
+        hoursDisplay.style.display = 'block';
+        calculateHours(staffName);
+    } else if (status === 'field_work') {
+        timeInputs.style.display = 'none';
+        hoursDisplay.style.display = 'block';
+        hoursSpan.textContent = '7.5';
+        pointsSpan.textContent = POINTS_CONFIG.field_work;
+    } else if (status === 'absent') {
+        timeInputs.style.display = 'none';
+        hoursDisplay.style.display = 'block';
+        hoursSpan.textContent = '0.0';
+        pointsSpan.textContent = POINTS_CONFIG.absent;
+    }
+}
+
+function calculateHours(staffName) {
+    const card = getStaffCard(staffName);
+    const entryTime = card.querySelector(`input[name$="_entry_time"]`).value;
+    const exitTime = card.querySelector(`input[name$="_exit_time"]`).value;
+    const hoursSpan = card.querySelector('.duty-hours');
+    const pointsSpan = card.querySelector('.points');
+    
+    if (entryTime && exitTime) {
+        const entry = new Date(`2000-01-01 ${entryTime}`);
+        const exit = new Date(`2000-01-01 ${exitTime}`);
+        
+        let hours = (exit - entry) / (1000 * 60 * 60);
+        if (hours < 0) hours += 24; // Handle overnight shifts
+        
+        hoursSpan.textContent = hours.toFixed(1);
+        
+        // Calculate points
+        let points = 0;
+        if (hours >= 7.5) {
+            points += POINTS_CONFIG.full_day_present;
+            if (hours > 7.5) {
+                points += Math.floor(hours - 7.5) * POINTS_CONFIG.overtime;
+            }
+        } else if (hours >= 4) {
+            points += POINTS_CONFIG.half_day_present;
+        }
+        
+        // Check for early/late arrival
+        const entryHour = entry.getHours();
+        const entryMinute = entry.getMinutes();
+        const entryDecimal = entryHour + entryMinute / 60;
+        
+        if (entryDecimal <= 10.0) {  // Before 10:00 AM
+            points += POINTS_CONFIG.early_arrival;
+        } else if (entryDecimal > 10.5) {  // After 10:30 AM
+            points += POINTS_CONFIG.late_arrival;
+        }
+        
+        pointsSpan.textContent = points > 0 ? '+' + points : points;
+    } else {
+        hoursSpan.textContent = '0.0';
+        pointsSpan.textContent = '0';
+    }
+}
+
+// Offline mode: edits go to a local queue (static/attendance-sync.js) and are sent in
+// batches, so saving keeps working while the office Wi-Fi is down
+const OFFLINE_SYNC = 'indexedDB' in window && typeof queueAttendanceChange === 'function';
+const SYNC_DELAY = 1000;
+const SYNC_RETRY_INTERVAL = 30000;
+let syncTimer = null;
+
+function getAttendanceDate() {
+    return document.querySelector('input[name="date"]').value;
+}
+
+function getCardChange(card) {
+    const checked = card.querySelector('input[type="radio"]:checked');
+    if (!checked) {
+        return null;
+    }
+    return {
+        branch: document.body.dataset.branch,
+        date: getAttendanceDate(),
+        staff_name: card.dataset.staff,
+        status: checked.value,
+        entry_time: card.querySelector('input[name$="_entry_time"]').value,
+        exit_time: card.querySelector('input[name$="_exit_time"]').value,
+        remarks: card.querySelector('textarea').value
+    };
+}
+
+// Save one staff member's entry without reloading the page
+function saveStaffAttendance(card) {
+    const payload = getCardChange(card);
+    if (!payload) {
+        return;
+    }
+    if (OFFLINE_SYNC) {
+        queueAttendanceChange(payload).then(scheduleSync, () => postStaffAttendance(card, payload));
+    } else {
+        postStaffAttendance(card, payload);
+    }
+}
+
+function postStaffAttendance(card, payload) {
+    fetch('/save_staff_attendance', {
+        method: 'POST',
+        headers: {'Content-Type': 'application/json'},
+        body: JSON.stringify(payload)
+    })
+        .then(response => response.json())
+        .then(result => {
+            if (!result.success) {
+                return;
+            }
+            // Show the server's figures, they are what was stored
+            card.querySelector('.duty-hours').textContent = result.duty_hours.toFixed(1);
+            card.querySelector('.points').textContent = result.points > 0 ? '+' + result.points : result.points;
+        })
+        .catch(() => {
+            // Unsaved changes are still sent by the Save Attendance button
+        });
+}
+
+function showSyncStatus(message, state) {
+    const status = document.getElementById('sync-status');
+    if (!status) {
+        return;
+    }
+    status.textContent = message;
+    status.dataset.state = state;
+    status.hidden = false;
+}
+
+function updateSyncStatus() {
+    return getQueuedChanges().then(queued => {
+        if (queued.length) {
+            showSyncStatus(`${queued.length} change${queued.length === 1 ? '' : 's'} saved on this device, waiting to sync`, 'pending');
+        } else {
+            showSyncStatus('All changes synced', 'synced');
+        }
+        return queued;
+    });
+}
+
+function scheduleSync() {
+    clearTimeout(syncTimer);
+    syncTimer = setTimeout(syncNow, SYNC_DELAY);
+    updateSyncStatus();
+}
+
+function syncNow() {
+    clearTimeout(syncTimer);
+    return flushAttendanceChanges()
+        .then(applySyncResults)
+        .catch(() => {
+            // Offline: let the service worker retry in the background where supported
+            if ('serviceWorker' in navigator && 'SyncManager' in window) {
+                navigator.serviceWorker.ready.then(registration => registration.sync.register('attendance-sync'));
+            }
+        })
+        .finally(updateSyncStatus);
+}
+
+function formatPoints(points) {
+    return points > 0 ? '+' + points : points;
+}
+
+// Show a record's values on its card (a queued edit, or the server's copy after a conflict)
+function applyRecordToCard(card, record) {
+    card.querySelectorAll('.radio-option').forEach(option => {
+        const input = option.querySelector('input');
+        input.checked = input.value === record.status;
+        option.classList.toggle('selected', input.checked);
+    });
+    card.querySelector('input[name$="_entry_time"]').value = record.entry_time || '';
+    card.querySelector('input[name$="_exit_time"]').value = record.exit_time || '';
+    card.querySelector('textarea').value = record.remarks || '';
+    toggleTimeInputs(card.dataset.staff, record.status);
+}
+
+function applySyncResults(results) {
+    const rejected = [];
+    results.forEach(result => {
+        if (result.result === 'rejected') {
+            rejected.push(`${result.staff_name} on ${result.date}: ${result.error}`);
+        }
+        if (!result.record || result.branch !== document.body.dataset.branch || result.date !== getAttendanceDate()) {
+            return;
+        }
+        const card = getStaffCard(result.staff_name);
+        if (!card) {
+            return;
+        }
+        if (result.result === 'conflict') {
+            // Someone saved this entry after the queued edit was made, theirs is kept
+            applyRecordToCard(card, result.record);
+            card.classList.add('sync-conflict');
+        }
+        // Show the server's figures, they are what was stored
+        card.querySelector('.duty-hours').textContent = result.record.duty_hours.toFixed(1);
+        card.querySelector('.points').textContent = formatPoints(result.record.points);
+    });
+    if (rejected.length) {
+        alert('Some changes could not be saved:\n' + rejected.join('\n'));
+    }
+}
+
+// Add interactivity to radio options
+document.querySelectorAll('.radio-option').forEach(option => {
+    option.addEventListener('click', function() {
+        const input = this.querySelector('input');
+        const card = this.closest('.staff-card');
+        
+        // Remove selected class from other options for this staff
+        card.querySelectorAll('.radio-option').forEach(other => {
+            other.classList.remove('selected');
+        });
+        
+        // Add selected class to clicked option
+        this.classList.add('selected');
+        input.checked = true;
+        
+        // Toggle time inputs
+        toggleTimeInputs(card.dataset.staff, input.value);
+        saveStaffAttendance(card);
+    });
+});
+
+// Recalculate and save when an entry time, exit time or remark changes
+document.addEventListener('change', function(event) {
+    const card = event.target.closest('.staff-card');
+    if (!card) {
+        return;
+    }
+    if (event.target.matches('input[type="time"]')) {
+        calculateHours(card.dataset.staff);
+    }
+    if (event.target.matches('input[type="time"], textarea')) {
+        saveStaffAttendance(card);
+    }
+});
+
+// Save the whole sheet through the queue instead of a full POST and redirect
+const attendanceForm = document.querySelector('form[action="/save_attendance"]');
+if (OFFLINE_SYNC && attendanceForm) {
+    attendanceForm.addEventListener('submit', function(event) {
+        event.preventDefault();
+        const changes = Array.from(document.querySelectorAll('.staff-card')).map(getCardChange).filter(Boolean);
+        Promise.all(changes.map(queueAttendanceChange))
+            .then(syncNow)
+            .catch(() => attendanceForm.submit());
+    });
+}
+
+// Reload the page for a newly picked date or branch
+document.querySelectorAll('#selected_date, #selected_branch').forEach(picker => {
+    picker.addEventListener('change', function() {
+        this.form.submit();
+    });
+});
+
+// Initialize each card from its saved status
+document.querySelectorAll('.staff-card').forEach(card => {
+    const checked = card.querySelector('input[type="radio"]:checked');
+    if (checked) {
+        toggleTimeInputs(card.dataset.staff, checked.value);
+    }
+});
+
+if (OFFLINE_SYNC) {
+    // A page served from the offline cache predates any queued edits, so show those on top
+    updateSyncStatus().then(queued => {
+        queued
+            .filter(change => change.branch === document.body.dataset.branch && change.date === getAttendanceDate())
+            .forEach(change => {
+                const card = getStaffCard(change.staff_name);
+                if (card) {
+                    applyRecordToCard(card, change);
+                }
+            });
+        if (queued.length) {
+            syncNow();
+        }
+    });
+    window.addEventListener('online', syncNow);
+    setInterval(() => {
+        getQueuedChanges().then(queued => {
+            if (queued.length && navigator.onLine) {
+                syncNow();
+            }
+        });
+    }, SYNC_RETRY_INTERVAL);
+
+    if ('serviceWorker' in navigator) {
+        navigator.serviceWorker.register('/service-worker.js');
+        navigator.serviceWorker.addEventListener('message', event => {
+            if (event.data && event.data.type === 'attendance-synced') {
+                applySyncResults(event.data.results);
+                updateSyncStatus();
+            }
+        });
+    }
+}
+
+// Render reports in the background and download them once ready
+const REPORT_POLL_INTERVAL = 1000;
+
+function pollReportJob(statusUrl, link) {
+    fetch(statusUrl)
+        .then(response => response.json())
+        .then(job => {
+            if (job.status === 'done') {
+                link.classList.remove('loading');
+                window.location = job.download_url;
+            } else if (job.status === 'failed') {
+                link.classList.remove('loading');
+                alert('Report failed: ' + job.error);
+            } else {
+                setTimeout(() => pollReportJob(statusUrl, link), REPORT_POLL_INTERVAL);
+            }
+        })
+        .catch(() => {
+            link.classList.remove('loading');
+            window.location = link.href;
+        });
+}
+
+document.querySelectorAll('a[data-report-type]').forEach(link => {
+    link.addEventListener('click', function(event) {
+        event.preventDefault();
+        if (this.classList.contains('loading')) {
+            return;
+        }
+        this.classList.add('loading');
+        
+        const params = Object.fromEntries(new URL(this.href).searchParams);
+        params.type = this.dataset.reportType;
+        
+        fetch('/report_jobs', {
+            method: 'POST',
+            headers: {'Content-Type': 'application/json'},
+            body: JSON.stringify(params)
+        })
+            .then(response => response.json())
+            .then(job => {
+                if (!job.status_url) {
+                    throw new Error(job.error);
+                }
+                pollReportJob(job.status_url, this);
+            })
+            .catch(() => {
+                // Fall back to the synchronous download
+                this.classList.remove('loading');
+                window.location = this.href;
+            });
+    });
+});
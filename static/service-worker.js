@@ -0,0 +1,67 @@
+// Keeps the check-in page usable offline: pages are served network-first with the
+// last good copy as fallback, static assets cache-first (their URLs are fingerprinted),
+// and queued attendance edits are sent by background sync where the browser has it.
+importScripts('/static/attendance-sync.js');
+
+const PAGE_CACHE = 'attendance-pages-v1';
+const ASSET_CACHE = 'attendance-assets-v1';
+const SYNC_TAG = 'attendance-sync';
+
+self.addEventListener('install', () => {
+    self.skipWaiting();
+});
+
+self.addEventListener('activate', event => {
+    const current = [PAGE_CACHE, ASSET_CACHE];
+    event.waitUntil(
+        caches.keys()
+            .then(names => Promise.all(names.filter(name => !current.includes(name)).map(name => caches.delete(name))))
+            .then(() => self.clients.claim())
+    );
+});
+
+self.addEventListener('fetch', event => {
+    const request = event.request;
+    const url = new URL(request.url);
+    if (request.method !== 'GET' || url.origin !== self.location.origin) {
+        return;
+    }
+
+    if (request.mode === 'navigate' && url.pathname === '/') {
+        event.respondWith(
+            fetch(request)
+                .then(response => {
+                    if (response.ok) {
+                        const copy = response.clone();
+                        caches.open(PAGE_CACHE).then(cache => cache.put(request, copy));
+                    }
+                    return response;
+                })
+                .catch(() => caches.match(request, {cacheName: PAGE_CACHE})
+                    .then(cached => cached || Response.error()))
+        );
+    } else if (url.pathname.startsWith('/static/')) {
+        event.respondWith(
+            caches.match(request, {cacheName: ASSET_CACHE}).then(cached => cached || fetch(request).then(response => {
+                if (response.ok) {
+                    const copy = response.clone();
+                    caches.open(ASSET_CACHE).then(cache => cache.put(request, copy));
+                }
+                return response;
+            }))
+        );
+    }
+});
+
+// Background sync retries on its own schedule until the flush succeeds
+self.addEventListener('sync', event => {
+    if (event.tag === SYNC_TAG) {
+        event.waitUntil(flushAttendanceChanges().then(results => notifyClients(results)));
+    }
+});
+
+function notifyClients(results) {
+    return self.clients.matchAll({type: 'window'}).then(clients => {
+        clients.forEach(client => client.postMessage({type: 'attendance-synced', results: results}));
+    });
+}